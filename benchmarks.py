@@ -0,0 +1,232 @@
+import world
+import pathfinding
+import kernels
+import numpy as np
+import functools
+import os
+import random
+import sys
+import tempfile
+import time
+from unittest import mock
+
+
+# synthetic terrain server (random walls and swamps, walled room edges that open up in the middle of each side)
+class SyntheticTerrainApi:
+
+    host = 'synthetic'
+
+    def __init__(self, wall_chance=.12, swamp_chance=.18):
+        self.wall_chance = wall_chance
+        self.swamp_chance = swamp_chance
+
+    def room_terrain(self, room, shard=None, encoded=True):
+        rng = random.Random(room)
+        terrain_characters = []
+        for terrain_index in range(0, 2500):
+            row, col = divmod(terrain_index, 50)
+            if row in [0, 49] or col in [0, 49]:
+                edge_position = col if row in [0, 49] else row
+                terrain_characters.append('0' if 18 <= edge_position <= 30 else '1')
+            else:
+                roll = rng.random()
+                terrain_characters.append('1' if roll < self.wall_chance else
+                                          '2' if roll < self.wall_chance + self.swamp_chance else '0')
+        return {'terrain': [{'room': room, 'terrain': ''.join(terrain_characters), 'type': 'terrain'}]}
+
+
+def synthetic_world(data_directory, bottom_left_room='W5N0', top_right_room='W0N5', terrain_api=None, **world_options):
+
+    # world config pointing at a throwaway data directory
+    config_file_location = os.path.join(data_directory, 'benchmark.config')
+    with open(config_file_location, 'w') as handle:
+        handle.write('[WORLD]\n')
+        handle.write(f'bottom_left_room = {bottom_left_room}\n')
+        handle.write(f'top_right_room = {top_right_room}\n')
+        handle.write(f'data_directory = {data_directory}\n')
+        for key, value in world_options.items():
+            handle.write(f'{key} = {value}\n')
+
+    with mock.patch('world.create_api_connection_from_config', return_value=terrain_api or SyntheticTerrainApi()):
+        return world.World(config_file_location=config_file_location)
+
+
+def open_points(benchmark_world, count, seed=0):
+
+    # random walkable points away from the room edges
+    rng = random.Random(seed)
+    height, width = benchmark_world.terrain.shape
+    points = []
+    while len(points) < count:
+        point = benchmark_world.point(x=rng.randrange(0, width), y=rng.randrange(0, height))
+        if point.terrain != 255 and not point.exit_tile:
+            points.append(point)
+    return points
+
+
+def cross_room_pairs(benchmark_world, count, seed=0):
+
+    # pairs of points at least one room apart
+    points = open_points(benchmark_world, count * 4, seed)
+    pairs = [(from_point, to_point) for from_point, to_point in zip(points[0::2], points[1::2])
+             if from_point.range(to_point) >= 50]
+    return pairs[:count]
+
+
+def report(name, elapsed, stats, searches):
+    print(f'{name:<24} {elapsed / searches * 1000:9.2f} ms/path {stats["expanded"] / searches:11.0f} expanded/path')
+
+
+# dijkstra (no heuristic) against the chebyshev a* on the same windows and weights
+def benchmark_astar(benchmark_world, path_count):
+    pairs = cross_room_pairs(benchmark_world, path_count)
+    for name, use_heuristic in [('dijkstra', False), ('chebyshev a*', True)]:
+        stats = {}
+        elapsed = 0
+        for from_point, to_point in pairs:
+            grid = benchmark_world.search_grid(from_point, to_point)
+            start = time.perf_counter()
+            pathfinding.astar_path(grid, grid.index(from_point.x, from_point.y), grid.index(to_point.x, to_point.y),
+                                   pathfinding.CostView(grid), None if use_heuristic else 0, stats)
+            elapsed += time.perf_counter() - start
+        report(name, elapsed, stats, len(pairs))
+
+
+# full window search against the room graph search on routes at least three rooms long
+def benchmark_hierarchical(benchmark_world, path_count):
+    pairs = [(from_point, to_point) for from_point, to_point in cross_room_pairs(benchmark_world, path_count * 4)
+             if from_point.range(to_point) >= 150][:path_count]
+
+    start = time.perf_counter()
+    benchmark_world.build_room_graphs()
+    print(f'{"room graphs":<24} {(time.perf_counter() - start) * 1000:9.2f} ms')
+
+    for name, search in [('full window', lambda from_point, to_point: benchmark_world.search_path(from_point, to_point)),
+                         ('hierarchical', benchmark_world.hierarchical_path)]:
+        stats = benchmark_world.path_search_stats = {}
+        start = time.perf_counter()
+        for from_point, to_point in pairs:
+            search(from_point, to_point)
+        report(name, time.perf_counter() - start, stats, len(pairs))
+
+
+# chebyshev a* against alt landmark a* on kingdom sized routes (one to three rooms)
+def benchmark_landmarks(benchmark_world, path_count):
+    pairs = [(from_point, to_point) for from_point, to_point in cross_room_pairs(benchmark_world, path_count * 4)
+             if from_point.range(to_point) < 150][:path_count]
+
+    start = time.perf_counter()
+    landmarks = benchmark_world.build_landmarks(save=False)
+    print(f'{"landmarks":<24} {(time.perf_counter() - start) * 1000:9.2f} ms for {len(landmarks.nodes)}')
+
+    for name, use_landmarks in [('chebyshev a*', False), ('alt a*', True)]:
+        benchmark_world.landmarks = landmarks if use_landmarks else None
+        stats = benchmark_world.path_search_stats = {}
+        start = time.perf_counter()
+        for from_point, to_point in pairs:
+            benchmark_world.search_path(from_point, to_point)
+        report(name, time.perf_counter() - start, stats, len(pairs))
+
+
+# a* against jump point search on mostly open plains (the same windows, weights and blocked tiles)
+def benchmark_jump_point(benchmark_world, path_count):
+    with tempfile.TemporaryDirectory() as data_directory:
+        plains_world = synthetic_world(data_directory, terrain_api=SyntheticTerrainApi(wall_chance=.01, swamp_chance=.02))
+        pairs = cross_room_pairs(plains_world, path_count)
+        for name, search in [('a*', pathfinding.astar_search), ('jump point', pathfinding.jump_point_search)]:
+            stats = {}
+            elapsed = 0
+            for from_point, to_point in pairs:
+                grid = plains_world.search_grid(from_point, to_point)
+                cost_view = plains_world.cost_view(grid)
+                grid.open_tiles()
+                start = time.perf_counter()
+                search(grid, grid.index(from_point.x, from_point.y), [grid.index(to_point.x, to_point.y)], cost_view,
+                       stats=stats)
+                elapsed += time.perf_counter() - start
+            report(name, elapsed, stats, len(pairs))
+
+
+# a* against the bidirectional search on long window routes (the hierarchical search off), on the usual terrain
+# and on swampier terrain where the chebyshev heuristic is weaker
+def benchmark_bidirectional(benchmark_world, path_count):
+    with tempfile.TemporaryDirectory() as data_directory:
+        swamp_world = synthetic_world(data_directory, terrain_api=SyntheticTerrainApi(wall_chance=.1, swamp_chance=.4))
+        for terrain_name, terrain_world in [('terrain', benchmark_world), ('swamp', swamp_world)]:
+            pairs = [(from_point, to_point) for from_point, to_point in cross_room_pairs(terrain_world, path_count * 10)
+                     if from_point.range(to_point) >= terrain_world.bidirectional_path_range][:path_count]
+            for name, search in [('a*', pathfinding.astar_search), ('bidirectional', pathfinding.bidirectional_search)]:
+                stats = {}
+                elapsed = 0
+                for from_point, to_point in pairs:
+                    grid = terrain_world.search_grid(from_point, to_point)
+                    cost_view = terrain_world.cost_view(grid)
+                    start = time.perf_counter()
+                    search(grid, grid.index(from_point.x, from_point.y), [grid.index(to_point.x, to_point.y)], cost_view,
+                           stats=stats)
+                    elapsed += time.perf_counter() - start
+                report(f'{terrain_name} {name}', elapsed, stats, len(pairs))
+
+
+# the python kernels against their numba compiled copies (compiled before timing): a* on the same windows, and the
+# store simulation over a long run of ticks
+def benchmark_kernels(benchmark_world, path_count):
+    backends = ['python'] + (['numba'] if kernels.numba is not None else [])
+    if len(backends) == 1:
+        print('numba is not installed, timing the python kernels only')
+    pairs = cross_room_pairs(benchmark_world, path_count)
+    searches = [('astar_search', pathfinding.astar_search)] + \
+        [(f'{backend} a*', functools.partial(pathfinding.compiled_astar_search, backend=backend)) for backend in backends]
+    for name, search in searches:
+        stats = {}
+        elapsed = 0
+        for from_point, to_point in pairs:
+            grid = benchmark_world.search_grid(from_point, to_point)
+            cost_view = benchmark_world.cost_view(grid)
+            if not stats:
+                search(grid, grid.index(from_point.x, from_point.y), [grid.index(to_point.x, to_point.y)], cost_view)
+            start = time.perf_counter()
+            search(grid, grid.index(from_point.x, from_point.y), [grid.index(to_point.x, to_point.y)], cost_view,
+                   stats=stats)
+            elapsed += time.perf_counter() - start
+        report(name, elapsed, stats, len(pairs))
+
+    rng = random.Random(0)
+    tick_count = 100000
+    operation_ticks = sorted([rng.randrange(tick_count) for _ in range(tick_count // 4)])
+    operation_resources = [rng.randrange(2) for _ in operation_ticks]
+    operation_amounts = [rng.choice([-50, -20, 10, 50]) for _ in operation_ticks]
+    operation_capped = [amount == 10 for amount in operation_amounts]
+    for backend in backends:
+        store_kernel = kernels.kernel(kernels.store_kernel, backend)
+        if backend == 'numba':
+            arguments = lambda: (np.array([300, 0]), np.array([300, 300]), 1, 0, tick_count, np.array(operation_ticks),
+                                 np.array(operation_resources), np.array(operation_amounts),
+                                 np.array(operation_capped))
+            store_kernel(*arguments())
+        else:
+            arguments = lambda: ([300, 0], [300, 300], 1, 0, tick_count, operation_ticks, operation_resources,
+                                 operation_amounts, operation_capped)
+        start = time.perf_counter()
+        store_kernel(*arguments())
+        print(f'{backend + " store":<24} {(time.perf_counter() - start) * 1000:9.2f} ms for {tick_count} ticks')
+
+
+BENCHMARKS = {
+    'astar': benchmark_astar,
+    'hierarchical': benchmark_hierarchical,
+    'landmarks': benchmark_landmarks,
+    'jump_point': benchmark_jump_point,
+    'bidirectional': benchmark_bidirectional,
+    'kernels': benchmark_kernels,
+}
+
+if __name__ == '__main__':
+
+    # python benchmarks.py [benchmark names...]
+    benchmark_names = sys.argv[1:] or list(BENCHMARKS)
+    with tempfile.TemporaryDirectory() as data_directory:
+        benchmark_world = synthetic_world(data_directory)
+        for benchmark_name in benchmark_names:
+            print(f'# {benchmark_name}')
+            BENCHMARKS[benchmark_name](benchmark_world, path_count=40)
@@ -53,6 +53,15 @@ class Director:
                 game_objects.append(game_object)
         return game_objects
 
+    def nearest_refill_source(self, creep, refill_sources, tick):
+
+        # by travel from where the creep is on that tick (the first one if none can be reached)
+        creep_location = creep.location(tick)
+        if creep_location is None:
+            return refill_sources[0]
+        refill_source, refill_path = self.world.nearest(creep_location, refill_sources, radius=1, tick=tick)
+        return refill_sources[0] if refill_source is None else refill_source
+
     @property
     def first_tick(self):
         return min([player.snapshot_tick for player in self.players])
@@ -287,8 +296,11 @@ class Director:
                                 if new_delivery_creep is not None:
                                     logger.info(
                                         f'before new creep transfers it has empty space of {new_delivery_creep.store_empty_space(tick)}')
-                                    new_delivery_creep.refill_resource(target=refill_sources[0],
-                                                                       start_tick=new_creep_spawn_start + delivery_creep_spawn_time + 1)
+                                    refill_start_tick = new_creep_spawn_start + delivery_creep_spawn_time + 1
+                                    new_delivery_creep.refill_resource(
+                                        target=self.nearest_refill_source(new_delivery_creep, refill_sources,
+                                                                          refill_start_tick),
+                                        start_tick=refill_start_tick)
                                     logger.info(
                                         f'after new creep transfers it has empty space of {new_delivery_creep.store_empty_space(tick)}')
                                     break
@@ -305,7 +317,7 @@ class Director:
                                 logger.info(
                                     f'refilling {delivery_creep.universal_id} because it isnt busy from {tick} and onward {delivery_creep.death_tick - tick}')
                                 delivery_creep.refill_resource(
-                                    target=refill_sources[0],
+                                    target=self.nearest_refill_source(delivery_creep, refill_sources, tick),
                                     start_tick=tick
                                 )
 
@@ -400,9 +412,10 @@ class Director:
                             # where would the creep spawn from
                             spawn_pt = spawn.spawn_point
 
-                            # TODO: devise a better way of selecting refill sources
-                            # refill this creep with energy to start
-                            new_upgrade_creep.refill_resource(target=refill_sources[0], start_tick=tick)
+                            # refill this creep with energy to start (from the nearest source by travel)
+                            new_upgrade_creep.refill_resource(
+                                target=self.nearest_refill_source(new_upgrade_creep, refill_sources, tick),
+                                start_tick=tick)
 
                             # figure out when we're not busy
                             start_upgrading_tick = tick
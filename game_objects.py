@@ -1,5 +1,7 @@
 import uuid
+import numpy as np
 from world import Point
+from kernels import kernel, store_kernel
 import constants
 from screeps_utilities import creep_body_resource_cost, delta_from_direction, creep_body_spawn_time
 
@@ -230,68 +232,58 @@ class GameObject:
         for resource_type in contents:
             logger.info(f'{resource_type} = {contents[resource_type]}')
 
-        # loop through all ticks
-        for tick in range(self.snapshot_tick, query_tick):
-
-            # regeneration if applicable (has to happen first)
-            if self.store.regen_per_tick != 0:
-                for resource_type in contents:
-                    if contents[resource_type] < self.store.max_capacity(resource_type):
-                        contents[resource_type] = min(contents[resource_type] + self.store.regen_per_tick,
-                                                      self.store.max_capacity(resource_type))
-
-            # hold all tasks for this tick in a list
-            tasks_to_process = []
-
-            # process all tasks to see if i'm the source or target
-            if tick in self.player.tasks:
+        # tasks that touch my store, by tick (tasks i complete and tasks that target me, then the task on test), task
+        # ticks are strings when they come from json
+        tick_tasks = {}
+        for tick in self.player.tasks:
+            if self.snapshot_tick <= int(tick) < query_tick:
                 for task_list in self.player.tasks[tick].values():
                     for task in task_list:
-                        # tasks I complete
                         if task['assigned_to'] == self.universal_id:
-                            tasks_to_process.append(task)
-                        # tasks that affect me
+                            tick_tasks.setdefault(int(tick), []).append(task)
                         elif 'target' in task['details']:
                             if task['details']['target'] == self.universal_id:
-                                tasks_to_process.append(task)
-
-            # add new task to process list
-            if test_store_related_task is not None:
-                if int(tick) == int(test_store_related_task['tick']):
-                    tasks_to_process.append(test_store_related_task)
+                                tick_tasks.setdefault(int(tick), []).append(task)
+        if test_store_related_task is not None:
+            test_tick = int(test_store_related_task['tick'])
+            if self.snapshot_tick <= test_tick < query_tick:
+                tick_tasks.setdefault(test_tick, []).append(test_store_related_task)
+
+        # turn them into store operations in the order they happen (resource, signed amount, capped at capacity)
+        resource_types = list(contents)
+        resource_numbers = dict([(resource_type, resource_number)
+                                 for resource_number, resource_type in enumerate(resource_types)])
+        operation_ticks = []
+        operation_resources = []
+        operation_amounts = []
+        operation_capped = []
+        for tick in sorted(tick_tasks):
+            for task in tick_tasks[tick]:
+                operation = None
 
-            # process tasks
-            for task in tasks_to_process:
                 # transfer task
                 if task['type'] == 'transfer':
                     if task['assigned_to'] == self.universal_id:
-                        contents[task['details']['resource_type']] -= task['details']['amount']
+                        operation = (task['details']['resource_type'], -task['details']['amount'], False)
                         logger.info(f'decrementing {task["details"]["resource_type"]} {task["details"]["amount"]}')
                     elif task['details']['target'] == self.universal_id:
+                        operation = (task['details']['resource_type'], task['details']['amount'], False)
                         logger.info(f'incrementing {task["details"]["amount"]}')
-                        contents[task['details']['resource_type']] += task['details']['amount']
 
                 # spawnCreep task
                 if task['type'] == 'spawnCreep':
 
-                    # calculate energy details
+                    # calculate energy details and remove it from the spawn
                     cost = creep_body_resource_cost(task['details']['body'])
-
-                    # remove it from the spawn
-                    contents['energy'] -= cost
+                    operation = ('energy', -cost, False)
                     logger.info(f'decrementing {cost}')
 
                 if task['type'] == 'harvest':
 
                     # calculate harvest amount
-                    work_parts = self.body.count('work')
-                    harvest_per_action = work_parts * 2
-
                     # TODO: make this work for more than energy sources
-                    contents['energy'] += harvest_per_action
-                    if contents['energy'] > self.store.max_capacity('energy'):
-                        contents['energy'] = self.store.max_capacity('energy')
-
+                    work_parts = self.body.count('work')
+                    operation = ('energy', work_parts * 2, True)
 
                     # withdraw task
                     # drop task
@@ -299,15 +291,45 @@ class GameObject:
                     # build task
                     # repair task
 
-            # test for goodness
-            # logger.info(f'store contents of {self.specific_type} at {tick} are {contents["energy"]}')
-            for resource_type in contents:
-                if contents[resource_type] < 0:
-                    logger.info(f'store contents of {self.specific_type} at {tick} are {contents["energy"]}')
-                    good_task = False
-        
+                if operation is not None:
+                    resource_type, amount, capped = operation
+                    operation_ticks.append(tick)
+                    operation_resources.append(resource_numbers[resource_type])
+                    operation_amounts.append(amount)
+                    operation_capped.append(capped)
+
+        # capacities regeneration and capped operations stop at
+        regen_per_tick = self.store.regen_per_tick
+        capped_resources = set([resource_number for resource_number, capped
+                                in zip(operation_resources, operation_capped) if capped])
+        capacities = [self.store.max_capacity(resource_type)
+                      if regen_per_tick != 0 or resource_number in capped_resources else 0
+                      for resource_number, resource_type in enumerate(resource_types)]
+
+        # run the ticks through the store kernel (compiled ones take arrays, the python one is quicker on lists)
+        values = [contents[resource_type] for resource_type in resource_types]
+        if self.world.kernel_backend == 'numba':
+            value_type = np.float64 if any([isinstance(value, float)
+                                            for value in values + capacities + operation_amounts + [regen_per_tick]]) \
+                else np.int64
+            values = np.array(values, dtype=value_type)
+            store_arguments = (values, np.array(capacities, dtype=value_type), value_type(regen_per_tick),
+                               self.snapshot_tick, query_tick, np.array(operation_ticks, dtype=np.int64),
+                               np.array(operation_resources, dtype=np.int64),
+                               np.array(operation_amounts, dtype=value_type), np.array(operation_capped, dtype=np.bool_))
+        else:
+            store_arguments = (values, capacities, regen_per_tick, self.snapshot_tick, query_tick, operation_ticks,
+                               operation_resources, operation_amounts, operation_capped)
+        negative_tick = kernel(store_kernel, self.world.kernel_backend)(*store_arguments)
+        contents = dict(zip(resource_types, values.tolist() if isinstance(values, np.ndarray) else values))
+
+        # test for goodness
+        if negative_tick >= 0:
+            logger.info(f'store contents of {self.specific_type} went negative at {negative_tick}')
+            good_task = False
+
         logger.info(f'expected contents of {self.specific_type} at {query_tick} are {contents}')
-        
+
         if test_store_related_task is None:
             return contents
         else:
@@ -832,7 +854,7 @@ class Spawn(GameObject):
                     self.add_task(task)
 
                 # return status
-                self.world.game_objects[spawned_creep.universal_id] = spawned_creep
+                self.world.add_game_objects({spawned_creep.universal_id: spawned_creep})
 
         return spawned_creep
 
@@ -0,0 +1,143 @@
+import heapq
+import numpy as np
+
+# logging
+import logging
+logger = logging.getLogger(__name__)
+
+# numba is optional, every kernel is plain python over numpy arrays that numba compiles as it is (and gives the
+# same answers either way)
+try:
+    import numba
+except ImportError:
+    numba = None
+
+BACKENDS = ['auto', 'python', 'numba']
+compiled_kernels = {}
+
+
+def resolve_backend(backend):
+
+    # auto compiles when numba is installed, asking for numba without it runs the python kernels
+    if backend not in BACKENDS:
+        raise ValueError(f'unknown kernel backend {backend}, expected one of {BACKENDS}')
+    if backend == 'auto':
+        return 'numba' if numba is not None else 'python'
+    if backend == 'numba' and numba is None:
+        logger.warning('numba is not installed, running the python kernels')
+        return 'python'
+    return backend
+
+
+def kernel(function, backend):
+
+    # the kernel itself or its compiled copy (compiled the first time it's asked for)
+    if backend != 'numba':
+        return function
+    if function not in compiled_kernels:
+        compiled_kernels[function] = numba.njit(cache=True)(function)
+    return compiled_kernels[function]
+
+
+def astar_kernel(base_weights, blocked, moves, step_bits, step_offsets, width, source, goal_numbers, target_ys,
+                 target_xs, radius, min_weight, heuristic, blocked_weight):
+
+    # pathfinding.astar_search over flat arrays (an empty heuristic means chebyshev), returns the path, target number
+    # and counts
+    size = base_weights.shape[0]
+    single_target = target_ys.shape[0] == 1
+    use_heuristic = heuristic.shape[0] > 0
+    g_scores = np.full(size, -1, dtype=np.int64)
+    parents = np.full(size, -1, dtype=np.int64)
+    closed = np.zeros(size, dtype=np.uint8)
+
+    g_scores[source] = 0
+    queue = [(np.int64(0), np.int64(0), np.int64(source))]
+    expanded = 0
+    pushed = 1
+    reached = -1
+    while len(queue) > 0:
+        f_score, h_score, index = heapq.heappop(queue)
+        if closed[index]:
+            continue
+        if goal_numbers[index] >= 0:
+            reached = index
+            break
+        closed[index] = 1
+        expanded += 1
+
+        if blocked[index]:
+            next_g_score = g_scores[index] + blocked_weight
+        else:
+            next_g_score = g_scores[index] + base_weights[index]
+        move_bits = moves[index]
+        for step_number in range(step_bits.shape[0]):
+            if move_bits & step_bits[step_number]:
+                neighbour = index + step_offsets[step_number]
+                if closed[neighbour]:
+                    continue
+                g_score = g_scores[neighbour]
+                if g_score < 0 or next_g_score < g_score:
+                    g_scores[neighbour] = next_g_score
+                    parents[neighbour] = index
+                    if use_heuristic:
+                        neighbour_h_score = np.int64(heuristic[neighbour])
+                    else:
+                        neighbour_y = neighbour // width
+                        neighbour_x = neighbour % width
+                        distance = -1
+                        for target_number in range(target_ys.shape[0]):
+                            d_x = abs(neighbour_x - target_xs[target_number])
+                            d_y = abs(neighbour_y - target_ys[target_number])
+                            target_distance = d_x if d_x > d_y else d_y
+                            if distance < 0 or target_distance < distance:
+                                distance = target_distance
+                            if single_target:
+                                break
+                        neighbour_h_score = np.int64((distance - radius) * min_weight if distance > radius else 0)
+                    heapq.heappush(queue, (np.int64(next_g_score + neighbour_h_score), neighbour_h_score,
+                                           np.int64(neighbour)))
+                    pushed += 1
+
+    # walk back from the tile we reached
+    if reached < 0:
+        return np.zeros(0, dtype=np.int64), -1, expanded, pushed
+    length = 1
+    index = reached
+    while index != source:
+        index = parents[index]
+        length += 1
+    path = np.empty(length, dtype=np.int64)
+    index = reached
+    for path_index in range(length - 1, -1, -1):
+        path[path_index] = index
+        index = parents[index]
+    return path, goal_numbers[reached], expanded, pushed
+
+
+def store_kernel(contents, capacities, regen_per_tick, start_tick, end_tick, operation_ticks, operation_resources,
+                 operation_amounts, operation_capped):
+
+    # store contents a tick at a time (regeneration then operations), returns the first negative tick or -1
+    negative_tick = -1
+    operation_number = 0
+    operation_count = len(operation_ticks)
+    while operation_number < operation_count and operation_ticks[operation_number] < start_tick:
+        operation_number += 1
+    for tick in range(start_tick, end_tick):
+        if regen_per_tick != 0:
+            for resource_number in range(len(contents)):
+                if contents[resource_number] < capacities[resource_number]:
+                    contents[resource_number] = min(contents[resource_number] + regen_per_tick,
+                                                    capacities[resource_number])
+        while operation_number < operation_count and operation_ticks[operation_number] == tick:
+            resource_number = operation_resources[operation_number]
+            contents[resource_number] += operation_amounts[operation_number]
+            if operation_capped[operation_number] and contents[resource_number] > capacities[resource_number]:
+                contents[resource_number] = capacities[resource_number]
+            operation_number += 1
+        if negative_tick < 0:
+            for resource_number in range(len(contents)):
+                if contents[resource_number] < 0:
+                    negative_tick = tick
+    return negative_tick
@@ -0,0 +1,1134 @@
+import bisect
+import heapq
+import os
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+import constants
+from kernels import kernel, astar_kernel
+from screeps_utilities import delta_from_direction
+
+# logging
+import logging
+logger = logging.getLogger(__name__)
+
+# move directions in screeps order (bit direction - 1 of the allowed move mask)
+DIRECTIONS = [constants.TOP, constants.TOP_RIGHT, constants.RIGHT, constants.BOTTOM_RIGHT,
+              constants.BOTTOM, constants.BOTTOM_LEFT, constants.LEFT, constants.TOP_LEFT]
+DIRECTION_DELTAS = [(delta_from_direction(direction)['x'], delta_from_direction(direction)['y'])
+                    for direction in DIRECTIONS]
+
+# extra path weight for stepping off an exit tile
+EXIT_TILE_PENALTY = .4
+
+# searches run on integer weights in tenths of a tile cost so the exit penalty stays exact
+PATH_WEIGHT_SCALE = 10
+EXIT_TILE_WEIGHT = 4
+BLOCKED_TILE_WEIGHT = 255 * PATH_WEIGHT_SCALE
+
+# terrain cost to scaled path weight, ignoring terrain differences remaps swamps (and roads) to plains
+TERRAIN_WEIGHTS = np.arange(256, dtype=np.int32) * PATH_WEIGHT_SCALE
+IGNORED_TERRAIN_WEIGHTS = TERRAIN_WEIGHTS.copy()
+IGNORED_TERRAIN_WEIGHTS[[1, 10]] = 2 * PATH_WEIGHT_SCALE
+
+# exit tile kinds (north/south exits can't move sideways onto another exit, east/west can't move up or down)
+EDGE_NONE = 0
+EDGE_NORTH_SOUTH = 1
+EDGE_EAST_WEST = 2
+
+
+def exit_tile_kinds(exits, x_offset=0):
+
+    # east/west wins on corners the same way Point.edge_type checks x first
+    height, width = exits.shape
+    room_x = (np.arange(width) + x_offset) % 50
+    east_west = exits & np.isin(room_x, [0, 49])[np.newaxis, :]
+    kinds = np.full(exits.shape, EDGE_NONE, dtype=np.uint8)
+    kinds[exits] = EDGE_NORTH_SOUTH
+    kinds[east_west] = EDGE_EAST_WEST
+    return kinds
+
+
+def allowed_move_mask(exits, x_offset=0):
+
+    # bit direction - 1 is set when the tile links to its neighbour in that direction
+    height, width = exits.shape
+    kinds = exit_tile_kinds(exits, x_offset)
+    moves = np.zeros(exits.shape, dtype=np.uint8)
+    for bit, (d_x, d_y) in enumerate(DIRECTION_DELTAS):
+
+        # tiles whose neighbour in this direction is inside the grid
+        from_rows = slice(max(0, -d_y), height - max(0, d_y))
+        from_cols = slice(max(0, -d_x), width - max(0, d_x))
+        to_rows = slice(max(0, d_y), height - max(0, -d_y))
+        to_cols = slice(max(0, d_x), width - max(0, -d_x))
+
+        # linkage logic for exit tiles (a link exists if either end allows it, like the old undirected graph)
+        from_kinds = kinds[from_rows, from_cols]
+        to_kinds = kinds[to_rows, to_cols]
+        blocked_from = exits[to_rows, to_cols] & (((from_kinds == EDGE_NORTH_SOUTH) & (d_x != 0)) |
+                                                  ((from_kinds == EDGE_EAST_WEST) & (d_y != 0)))
+        blocked_to = exits[from_rows, from_cols] & (((to_kinds == EDGE_NORTH_SOUTH) & (d_x != 0)) |
+                                                    ((to_kinds == EDGE_EAST_WEST) & (d_y != 0)))
+        moves[from_rows, from_cols] |= (~(blocked_from & blocked_to)).astype(np.uint8) << bit
+
+    return moves
+
+
+class SearchGrid:
+
+    def __init__(self, cost, exits, x_offset=0, y_offset=0):
+
+        # window position in world coordinates
+        self.x_offset = x_offset
+        self.y_offset = y_offset
+        self.height, self.width = cost.shape
+        self.size = self.height * self.width
+
+        # flat layers (memoryviews index to plain ints quickly from python)
+        self.cost_array = np.ascontiguousarray(cost, dtype=np.uint8).ravel()
+        self.exit_array = np.ascontiguousarray(exits, dtype=np.uint8).ravel()
+        self.move_array = allowed_move_mask(np.asarray(exits, dtype=bool), x_offset).ravel()
+        self.cost = memoryview(self.cost_array)
+        self.exits = memoryview(self.exit_array)
+        self.moves = memoryview(self.move_array)
+
+        # neighbour index offset for each move bit
+        self.steps = [(1 << bit, d_y * self.width + d_x) for bit, (d_x, d_y) in enumerate(DIRECTION_DELTAS)]
+
+        # immutable scaled weights per terrain mode (built the first time a mode is searched)
+        self.base_layers = {}
+        self.open_layers = {}
+
+        # window indexes of the world's static obstacles and the layer version they were taken from
+        self.static_layer = frozenset()
+        self.static_layer_version = 0
+
+        # sparse adjacency structure (built the first time a materialized graph is needed)
+        self.adjacency = None
+        self.edge_sources = None
+
+    def contains(self, x, y):
+        return self.x_offset <= x < self.x_offset + self.width and self.y_offset <= y < self.y_offset + self.height
+
+    def index(self, x, y):
+        return (y - self.y_offset) * self.width + (x - self.x_offset)
+
+    def node(self, index):
+        local_y, local_x = divmod(index, self.width)
+        return local_x + self.x_offset, local_y + self.y_offset
+
+    def neighbours(self, index):
+        moves = self.moves[index]
+        for bit, step in self.steps:
+            if moves & bit:
+                yield index + step
+
+    def adjacency_structure(self):
+
+        # one edge per set move bit, rows are the tile being left
+        if self.adjacency is None:
+            sources = []
+            targets = []
+            for bit, step in self.steps:
+                tiles = np.flatnonzero(self.move_array & bit)
+                sources.append(tiles)
+                targets.append(tiles + step)
+            sources = np.concatenate(sources)
+            targets = np.concatenate(targets)
+            self.adjacency = csr_matrix((np.ones(len(sources), dtype=np.uint8), (sources, targets)),
+                                        shape=(self.size, self.size))
+            self.edge_sources = np.repeat(np.arange(self.size), np.diff(self.adjacency.indptr))
+        return self.adjacency, self.edge_sources
+
+    def base_weights(self, ignore_terrain_differences=False):
+
+        # the scaled weight of leaving each tile (exit tiles keep their terrain cost plus the penalty)
+        if ignore_terrain_differences not in self.base_layers:
+            terrain_weights = IGNORED_TERRAIN_WEIGHTS if ignore_terrain_differences else TERRAIN_WEIGHTS
+            weights = np.where(self.exit_array.astype(bool), TERRAIN_WEIGHTS[self.cost_array] + EXIT_TILE_WEIGHT,
+                               terrain_weights[self.cost_array]).astype(np.int32)
+            weights.flags.writeable = False
+            self.base_layers[ignore_terrain_differences] = weights, int(weights.min())
+        return self.base_layers[ignore_terrain_differences]
+
+    def open_tiles(self, ignore_terrain_differences=False):
+
+        # tiles that can move every way onto tiles weighted the same as themselves (where jump point search can
+        # walk on without queueing anything, the window edge never is) and, per move direction, how many moves
+        # from each of them the next tile that isn't open is
+        if ignore_terrain_differences not in self.open_layers:
+            weights = self.base_weights(ignore_terrain_differences)[0].reshape(self.height, self.width)
+            open_tiles = (self.move_array == 255).reshape(self.height, self.width)
+            for d_x, d_y in DIRECTION_DELTAS:
+                open_tiles &= np.roll(weights, (-d_y, -d_x), axis=(0, 1)) == weights
+            open_tiles = open_tiles.ravel()
+
+            # order the tiles along each direction's lines (every line ends on the window edge, which isn't open)
+            tile_y, tile_x = np.divmod(np.arange(self.size), self.width)
+            jump_distances = np.zeros((len(DIRECTION_DELTAS), self.size), dtype=np.int32)
+            for step_number, (d_x, d_y) in enumerate(DIRECTION_DELTAS):
+                order = np.lexsort((tile_x * d_x + tile_y * d_y, tile_x * d_y - tile_y * d_x))
+                ranks = np.arange(self.size)
+                stops = np.where(open_tiles[order], self.size, ranks)
+                next_stops = np.append(np.minimum.accumulate(stops[::-1])[::-1][1:], self.size)
+                jump_distances[step_number, order] = next_stops - ranks
+
+            open_tiles = open_tiles.astype(np.uint8)
+            open_tiles.flags.writeable = False
+            jump_distances.flags.writeable = False
+            self.open_layers[ignore_terrain_differences] = open_tiles, jump_distances
+        return self.open_layers[ignore_terrain_differences]
+
+    def tile_weights(self, blocked_indexes=(), ignore_terrain_differences=False):
+
+        # dense copy of the base layer with the blocked tiles stamped in
+        weights = self.base_weights(ignore_terrain_differences)[0].copy()
+        weights[np.fromiter(blocked_indexes, dtype=np.int64, count=len(blocked_indexes))] = BLOCKED_TILE_WEIGHT
+        return weights
+
+    def csr_adjacency(self, weights):
+
+        # directed, weighted by the tile being left
+        adjacency, edge_sources = self.adjacency_structure()
+        return csr_matrix((weights[edge_sources], adjacency.indices, adjacency.indptr), shape=(self.size, self.size))
+
+
+def scaled_distance_matrix(graph, sources, targets):
+
+    # one dijkstra per distinct source through csgraph, unreachable targets are inf
+    unique_sources, source_rows = np.unique(np.asarray(sources, dtype=np.int64), return_inverse=True)
+    distances = dijkstra(graph, directed=True, indices=unique_sources)
+    return distances[np.ix_(source_rows, np.asarray(targets, dtype=np.int64))]
+
+
+def distance_matrix(graph, sources, targets):
+    return scaled_distance_matrix(graph, sources, targets) / PATH_WEIGHT_SCALE
+
+
+class RoomGraph:
+
+    # exit portals of a single room grid with the in-room travel costs between them (scaled weights, inf when
+    # the room cuts them off), the adjacency is dropped once the costs are known
+    def __init__(self, grid, portals, ignore_terrain_differences=False):
+        self.portals = [node for node, partner in portals]
+        self.partners = [partner for node, partner in portals]
+        self.portal_index = dict([(node, portal_number) for portal_number, node in enumerate(self.portals)])
+
+        # leaving a portal for its partner in the next room costs the portal's own weight
+        base_weights = grid.base_weights(ignore_terrain_differences)[0]
+        portal_indexes = [grid.index(x, y) for x, y in self.portals]
+        self.crossing_weights = [int(base_weights[index]) for index in portal_indexes]
+        self.costs = np.empty((0, 0))
+        if portal_indexes:
+            self.costs = scaled_distance_matrix(grid.csr_adjacency(base_weights), portal_indexes, portal_indexes)
+
+
+class FlowField:
+
+    # distance to a target from every tile of a window and the screeps direction of the next step (0 where there's
+    # no way to the target), from one dijkstra over the reversed graph
+    def __init__(self, grid, graph, target):
+        self.grid = grid
+        self.target = target
+        distances, predecessors = dijkstra(graph.T.tocsr(), directed=True, indices=target, return_predecessors=True)
+        self.distance_array = distances / PATH_WEIGHT_SCALE
+
+        # the predecessor on the way back from the target is the next step towards it
+        steps = predecessors - np.arange(grid.size)
+        self.direction_array = np.zeros(grid.size, dtype=np.uint8)
+        for direction, (d_x, d_y) in zip(DIRECTIONS, DIRECTION_DELTAS):
+            self.direction_array[(predecessors >= 0) & (steps == d_y * grid.width + d_x)] = direction
+        self.distances = memoryview(self.distance_array)
+        self.directions = memoryview(self.direction_array)
+
+    def next_direction(self, x, y):
+        if not self.grid.contains(x, y):
+            return 0
+        return self.directions[self.grid.index(x, y)]
+
+    def distance(self, x, y):
+        if not self.grid.contains(x, y):
+            return float('inf')
+        return self.distances[self.grid.index(x, y)]
+
+
+class ExitTables:
+
+    # per room travel costs between its exit portals and its sources, controllers and spawns, kept as flat arrays
+    # (room r owns table nodes node_offsets[r]:node_offsets[r + 1], portals first, and a square block of costs)
+    def __init__(self, rooms, room_names, room_hashes, node_offsets, portal_counts, nodes, partners, crossing_weights, object_ids,
+                 cost_offsets, costs):
+        self.rooms = rooms
+        self.room_names = room_names
+        self.room_hashes = room_hashes
+        self.node_offsets = node_offsets
+        self.portal_counts = portal_counts
+        self.nodes = nodes
+        self.partners = partners
+        self.crossing_weights = crossing_weights
+        self.object_ids = object_ids
+        self.cost_offsets = cost_offsets
+        self.costs = costs
+
+        # lookups from rooms, portal tiles and objects to table numbers
+        self.room_numbers = dict([((int(row), int(col)), room_number) for room_number, (row, col) in enumerate(rooms)])
+        self.node_rooms = np.repeat(np.arange(len(rooms)), np.diff(node_offsets))
+        self.portal_numbers = {}
+        self.object_numbers = {}
+        for node_number, (x, y) in enumerate(nodes.tolist()):
+            if object_ids[node_number]:
+                self.object_numbers[str(object_ids[node_number])] = node_number
+            else:
+                self.portal_numbers[(x, y)] = node_number
+
+    @classmethod
+    def from_rooms(cls, room_tables):
+
+        # room_tables holds a dict per room with its row, col, name, hash, portals, crossing weights, objects
+        # as (object id, node) and the square cost block over portals then objects
+        node_counts = [len(room_table['portals']) + len(room_table['objects']) for room_table in room_tables]
+        nodes = []
+        partners = []
+        crossing_weights = []
+        object_ids = []
+        for room_table in room_tables:
+            portals = room_table['portals']
+            objects = room_table['objects']
+            nodes.extend([node for node, partner in portals] + [node for object_id, node in objects])
+            partners.extend([partner for node, partner in portals] + [(-1, -1)] * len(objects))
+            crossing_weights.extend(list(room_table['crossing_weights']) + [0] * len(objects))
+            object_ids.extend([''] * len(portals) + [object_id for object_id, node in objects])
+        return cls(rooms=np.array([(room_table['row'], room_table['col']) for room_table in room_tables],
+                                  dtype=np.int32).reshape(-1, 2),
+                   room_names=np.array([room_table['room_name'] for room_table in room_tables], dtype=str),
+                   room_hashes=np.array([room_table['room_hash'] for room_table in room_tables], dtype=str),
+                   node_offsets=np.concatenate([[0], np.cumsum(node_counts)]).astype(np.int64),
+                   portal_counts=np.array([len(room_table['portals']) for room_table in room_tables], dtype=np.int32),
+                   nodes=np.array(nodes, dtype=np.int32).reshape(-1, 2),
+                   partners=np.array(partners, dtype=np.int32).reshape(-1, 2),
+                   crossing_weights=np.array(crossing_weights, dtype=np.int32),
+                   object_ids=np.array(object_ids, dtype=str),
+                   cost_offsets=np.concatenate([[0], np.cumsum(np.square(node_counts))]).astype(np.int64),
+                   costs=np.concatenate([np.ravel(room_table['costs']) for room_table in room_tables] +
+                                        [np.empty(0)]).astype(np.float32))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            return cls(**dict(arrays))
+
+    def save(self, path):
+        np.savez_compressed(path, rooms=self.rooms, room_names=self.room_names, room_hashes=self.room_hashes, node_offsets=self.node_offsets,
+                            portal_counts=self.portal_counts, nodes=self.nodes, partners=self.partners,
+                            crossing_weights=self.crossing_weights, object_ids=self.object_ids,
+                            cost_offsets=self.cost_offsets, costs=self.costs)
+
+    def room_costs(self, room_number):
+        node_count = self.node_offsets[room_number + 1] - self.node_offsets[room_number]
+        return self.costs[self.cost_offsets[room_number]:self.cost_offsets[room_number + 1]].reshape(node_count, node_count)
+
+    def route_cost(self, from_number, to_number):
+
+        # portal search over the table nodes, objects are only ever endpoints (scaled weights, inf without a route)
+        target_x, target_y = self.nodes[to_number].tolist()
+
+        def links(node_number):
+            room_number = self.node_rooms[node_number]
+            first_number = self.node_offsets[room_number]
+            portal_count = self.portal_counts[room_number]
+            local_number = node_number - first_number
+            if local_number >= portal_count and node_number != from_number:
+                return []
+
+            # across the room, then over the edge into the next one
+            next_nodes = [(first_number + other_number, int(cost))
+                          for other_number, cost in enumerate(self.room_costs(room_number)[local_number].tolist())
+                          if other_number != local_number and cost != float('inf')]
+            if local_number < portal_count:
+                partner = tuple(self.partners[node_number].tolist())
+                if partner in self.portal_numbers:
+                    next_nodes.append((self.portal_numbers[partner], int(self.crossing_weights[node_number])))
+            return next_nodes
+
+        def heuristic(node_number):
+            node_x, node_y = self.nodes[node_number].tolist()
+            return max(abs(node_x - target_x), abs(node_y - target_y)) * 2 * PATH_WEIGHT_SCALE
+
+        route_cost = portal_search([(from_number, 0)], to_number, links, heuristic)[0]
+        return float('inf') if route_cost is None else route_cost
+
+
+def portal_search(starts, goal, links, heuristic):
+
+    # a* over room portals (starts are (node, cost) pairs, links gives a node's (next node, cost) pairs), returns
+    # the cost to the goal and the nodes on the way there, (None, None) without a route
+    g_scores = {}
+    parents = {}
+    queue = []
+
+    def relax(node, parent, g_score):
+        if g_score < g_scores.get(node, float('inf')):
+            g_scores[node] = g_score
+            parents[node] = parent
+            heapq.heappush(queue, (g_score + heuristic(node), g_score, node))
+
+    for node, g_score in starts:
+        relax(node, None, g_score)
+    closed = set()
+    while queue:
+        f_score, g_score, node = heapq.heappop(queue)
+        if node == goal:
+            nodes = [node]
+            while parents[nodes[-1]] is not None:
+                nodes.append(parents[nodes[-1]])
+            nodes.reverse()
+            return g_score, nodes
+        if node in closed:
+            continue
+        closed.add(node)
+        for next_node, cost in links(node):
+            relax(next_node, node, g_score + cost)
+    return None, None
+
+
+class Landmarks:
+
+    # scaled distances from each landmark to every world tile (forward) and from every tile to it (backward),
+    # saturating at SATURATED (unreachable tiles included, the distance is at least that), with the rooms they
+    # were built on
+    SATURATED = np.iinfo(np.uint16).max
+
+    # arrays saved one .npy each (nodes last, so a half written set is never loaded)
+    ARRAYS = ['forward', 'backward', 'rooms', 'room_names', 'room_hashes', 'nodes']
+
+    def __init__(self, nodes, forward, backward, rooms, room_names, room_hashes):
+        self.nodes = nodes
+        self.forward = forward
+        self.backward = backward
+        self.rooms = rooms
+        self.room_names = room_names
+        self.room_hashes = room_hashes
+
+    @staticmethod
+    def compact_distances(distances, shape):
+        return np.minimum(np.where(np.isfinite(distances), distances, Landmarks.SATURATED),
+                          Landmarks.SATURATED).astype(np.uint16).reshape(shape)
+
+    @classmethod
+    def build(cls, grid, graph, count, rooms, room_names, room_hashes):
+
+        # farthest point selection: each landmark is the walkable tile furthest from the landmarks so far
+        # (the first one is furthest from an arbitrary walkable tile)
+        reversed_graph = graph.T.tocsr()
+        shape = (grid.height, grid.width)
+        walkable = grid.cost_array != 255
+        spread = dijkstra(graph, directed=True, indices=int(np.flatnonzero(walkable)[0]))
+        nodes = []
+        forward = []
+        backward = []
+        for landmark_number in range(0, count):
+            landmark = int(np.argmax(np.where(walkable & np.isfinite(spread), spread, -1)))
+            forward_distances = dijkstra(graph, directed=True, indices=landmark)
+            backward_distances = dijkstra(reversed_graph, directed=True, indices=landmark)
+            spread = forward_distances if landmark_number == 0 else np.minimum(spread, forward_distances)
+            nodes.append(grid.node(landmark))
+            forward.append(cls.compact_distances(forward_distances, shape))
+            backward.append(cls.compact_distances(backward_distances, shape))
+        return cls(np.array(nodes, dtype=np.int32).reshape(-1, 2), np.array(forward), np.array(backward),
+                   rooms, room_names, room_hashes)
+
+    @classmethod
+    def load(cls, path):
+
+        # mapped read only, searches only page in the rows of their window
+        return cls(**dict([(name, np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')) for name in cls.ARRAYS]))
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for name in self.ARRAYS:
+            temp_path = os.path.join(path, f'{name}.npy.tmp')
+            with open(temp_path, 'wb') as handle:
+                np.save(handle, getattr(self, name))
+            os.replace(temp_path, os.path.join(path, f'{name}.npy'))
+
+    def heuristic(self, grid, target_x, target_y, source_index, min_weight, active_count=4):
+
+        # window of each field
+        window = (slice(None), slice(grid.y_offset, grid.y_offset + grid.height),
+                  slice(grid.x_offset, grid.x_offset + grid.width))
+        forward = self.forward[window].reshape(len(self.nodes), -1).astype(np.int64)
+        backward = self.backward[window].reshape(len(self.nodes), -1).astype(np.int64)
+        forward_target = self.forward[:, target_y, target_x].astype(np.int64)[:, np.newaxis]
+        backward_target = self.backward[:, target_y, target_x].astype(np.int64)[:, np.newaxis]
+
+        # triangle inequality bounds d(L, t) - d(L, v) and d(v, L) - d(t, L) (saturating both sides only ever
+        # lowers a bound, so they stay admissible)
+        bounds = np.maximum(forward_target - forward, backward - backward_target)
+
+        # only the landmarks that bound the source best, never below the chebyshev bound
+        active = np.argsort(bounds[:, source_index])[::-1][:active_count]
+        local_y, local_x = np.divmod(np.arange(grid.size), grid.width)
+        chebyshev = np.maximum(np.abs(local_x + grid.x_offset - target_x), np.abs(local_y + grid.y_offset - target_y))
+        return np.maximum(bounds[active].max(axis=0), chebyshev * min_weight).astype(np.int64)
+
+
+class CostView:
+
+    # layered weights: the grid's immutable base layer, then the shared static obstacle layer, then per-query
+    # blocked tiles (nothing is copied, so setup scales with the number of overrides)
+    def __init__(self, grid, ignore_terrain_differences=False, static_indexes=frozenset(), override_indexes=frozenset()):
+        base, self.min_weight = grid.base_weights(ignore_terrain_differences)
+        self.base = memoryview(base)
+        self.ignore_terrain_differences = ignore_terrain_differences
+        self.static_indexes = static_indexes
+        self.override_indexes = override_indexes
+
+    def weight(self, index):
+        if index in self.override_indexes or index in self.static_indexes:
+            return BLOCKED_TILE_WEIGHT
+        return self.base[index]
+
+
+def goal_indexes(grid, target, radius=0):
+    target_y, target_x = divmod(target, grid.width)
+    return [tile_y * grid.width + tile_x
+            for tile_y in range(max(0, target_y - radius), min(grid.height, target_y + radius + 1))
+            for tile_x in range(max(0, target_x - radius), min(grid.width, target_x + radius + 1))]
+
+
+def search_goals(grid, targets, cost_view, radius=0):
+
+    # tiles a search can end on and the number of the target each is in range of (the first target wins a tile in
+    # range of several), walls and blocked tiles only count when they're the target itself
+    blocked_indexes = cost_view.static_indexes | cost_view.override_indexes
+    goals = {}
+    for target_number, target in enumerate(targets):
+        for tile_index in goal_indexes(grid, target, radius):
+            if tile_index == target or (grid.cost[tile_index] != 255 and tile_index not in blocked_indexes):
+                goals.setdefault(tile_index, target_number)
+    return goals
+
+
+def search_heuristic(grid, targets, min_weight, heuristic=None, radius=0):
+
+    # h score of a grid index, the chebyshev distance past the radius to the nearest target times the smallest weight
+    # unless there's a precomputed heuristic
+    if heuristic is not None:
+        return heuristic.__getitem__
+    width = grid.width
+    target_nodes = [divmod(target, width) for target in targets]
+    if len(target_nodes) == 1:
+        target_y, target_x = target_nodes[0]
+
+        def h_score(index):
+            index_y, index_x = divmod(index, width)
+            d_x = abs(index_x - target_x)
+            d_y = abs(index_y - target_y)
+            distance = d_x if d_x > d_y else d_y
+            return (distance - radius) * min_weight if distance > radius else 0
+    else:
+
+        def h_score(index):
+            index_y, index_x = divmod(index, width)
+            distance = min([max(abs(index_x - goal_x), abs(index_y - goal_y)) for goal_y, goal_x in target_nodes])
+            return (distance - radius) * min_weight if distance > radius else 0
+    return h_score
+
+
+def count_search(stats, expanded, pushed):
+    if stats is not None:
+        stats['searches'] = stats.get('searches', 0) + 1
+        stats['expanded'] = stats.get('expanded', 0) + int(expanded)
+        stats['pushed'] = stats.get('pushed', 0) + int(pushed)
+
+
+def astar_path(grid, source, target, cost_view, min_weight=None, stats=None, heuristic=None, radius=0):
+    return astar_search(grid, source, [target], cost_view, min_weight, stats, heuristic, radius)[0]
+
+
+def astar_search(grid, source, targets, cost_view, min_weight=None, stats=None, heuristic=None, radius=0):
+
+    # a* to the first tile in range of any target, returns the path and the number of the target it reached
+    if min_weight is None:
+        min_weight = cost_view.min_weight
+    base_weights = cost_view.base
+    static_indexes = cost_view.static_indexes
+    override_indexes = cost_view.override_indexes
+    moves = grid.moves
+    steps = grid.steps
+    goals = search_goals(grid, targets, cost_view, radius)
+    h_score = search_heuristic(grid, targets, min_weight, heuristic, radius)
+
+    # flat g scores and parent pointers, -1 until a tile is reached
+    g_array = np.full(grid.size, -1, dtype=np.int64)
+    parent_array = np.full(grid.size, -1, dtype=np.int64)
+    g_scores = memoryview(g_array)
+    parents = memoryview(parent_array)
+    closed = bytearray(grid.size)
+
+    g_scores[source] = 0
+    queue = [(0, 0, source)]
+    expanded = 0
+    pushed = 1
+    reached = None
+    while queue:
+        f_score, index_h_score, index = heapq.heappop(queue)
+        if closed[index]:
+            continue
+        if index in goals:
+            reached = index
+            break
+        closed[index] = 1
+        expanded += 1
+
+        if index in override_indexes or index in static_indexes:
+            next_g_score = g_scores[index] + BLOCKED_TILE_WEIGHT
+        else:
+            next_g_score = g_scores[index] + base_weights[index]
+        move_bits = moves[index]
+        for bit, step in steps:
+            if move_bits & bit:
+                neighbour = index + step
+                if closed[neighbour]:
+                    continue
+                g_score = g_scores[neighbour]
+                if g_score < 0 or next_g_score < g_score:
+                    g_scores[neighbour] = next_g_score
+                    parents[neighbour] = index
+                    neighbour_h_score = h_score(neighbour)
+                    heapq.heappush(queue, (next_g_score + neighbour_h_score, neighbour_h_score, neighbour))
+                    pushed += 1
+    count_search(stats, expanded, pushed)
+
+    # no way to any target
+    if reached is None:
+        return None, None
+
+    # walk back from the tile we reached
+    path = [reached]
+    while path[-1] != source:
+        path.append(parents[path[-1]])
+    path.reverse()
+    return path, goals[reached]
+
+
+def jump_point_search(grid, source, targets, cost_view, min_weight=None, stats=None, heuristic=None, radius=0):
+
+    # astar_search that jumps straight and diagonal moves across open plains and only queues where they stop
+    if min_weight is None:
+        min_weight = cost_view.min_weight
+    base_weights = cost_view.base
+    static_indexes = cost_view.static_indexes
+    override_indexes = cost_view.override_indexes
+    width = grid.width
+    moves = grid.moves
+    steps = grid.steps
+    target_nodes = [divmod(target, width) for target in targets]
+    open_tiles, jump_distances = grid.open_tiles(cost_view.ignore_terrain_differences)
+    jumps = [memoryview(jump_distances[step_number]) for step_number in range(len(steps))]
+
+    # blocked tiles close the plains around them, jumps stop at the first closed tile along their line
+    closed_plains = set()
+    for index in static_indexes | override_indexes:
+        closed_plains.update([index] + [index + step for bit, step in steps])
+    closed_plains = [index for index in closed_plains if 0 <= index < grid.size]
+    closed_lines = [{} for step in steps]
+    if closed_plains:
+        open_tiles = open_tiles.copy()
+        open_tiles[closed_plains] = 0
+        for index in closed_plains:
+            index_y, index_x = divmod(index, width)
+            for step_number, (d_x, d_y) in enumerate(DIRECTION_DELTAS):
+                closed_lines[step_number].setdefault(index_x * d_y - index_y * d_x, []).append(index_x * d_x + index_y * d_y)
+        for lines in closed_lines:
+            for positions in lines.values():
+                positions.sort()
+    open_tiles = memoryview(open_tiles)
+
+    # the straight parts of each diagonal move
+    step_numbers = dict([((d_x, d_y), step_number) for step_number, (d_x, d_y) in enumerate(DIRECTION_DELTAS)])
+    step_parts = [[step_numbers[(d_x, 0)], step_numbers[(0, d_y)]] if d_x and d_y else []
+                  for d_x, d_y in DIRECTION_DELTAS]
+
+    goals = search_goals(grid, targets, cost_view, radius)
+    h_score = search_heuristic(grid, targets, min_weight, heuristic, radius)
+
+    def jump_length(index, step_number):
+
+        # moves until the first tile that isn't open, is closed or is in range of a target
+        length = jumps[step_number][index]
+        d_x, d_y = DIRECTION_DELTAS[step_number]
+        index_y, index_x = divmod(index, width)
+        if closed_plains:
+            positions = closed_lines[step_number].get(index_x * d_y - index_y * d_x)
+            if positions:
+                position = index_x * d_x + index_y * d_y
+                closed_number = bisect.bisect_right(positions, position)
+                if closed_number < len(positions):
+                    length = min(length, (positions[closed_number] - position) // (d_x * d_x + d_y * d_y))
+        for goal_y, goal_x in target_nodes:
+            if d_x == 0:
+                if abs(index_x - goal_x) > radius:
+                    continue
+                first_move = last_move = (goal_y - index_y) * d_y
+            elif d_y == 0:
+                if abs(index_y - goal_y) > radius:
+                    continue
+                first_move = last_move = (goal_x - index_x) * d_x
+            else:
+                first_move = max((goal_x - index_x) * d_x, (goal_y - index_y) * d_y)
+                last_move = min((goal_x - index_x) * d_x, (goal_y - index_y) * d_y)
+            first_move = max(1, first_move - radius)
+            if first_move <= last_move + radius and first_move < length:
+                length = first_move
+        return length
+
+    # flat g scores, the jump point each tile was reached from and the moves that reached it at that score
+    g_array = np.full(grid.size, -1, dtype=np.int64)
+    parent_array = np.full(grid.size, -1, dtype=np.int64)
+    arrival_array = np.zeros(grid.size, dtype=np.uint8)
+    g_scores = memoryview(g_array)
+    parents = memoryview(parent_array)
+    arrivals = memoryview(arrival_array)
+    closed = bytearray(grid.size)
+    queue = []
+    counters = [0, 1]
+
+    def reach(index, g_score, step_number, parent):
+
+        # equal scores through another move are kept too, an open tile has to carry on those moves as well
+        step_bit = 1 << step_number
+        current_g_score = g_scores[index]
+        if current_g_score < 0 or g_score < current_g_score:
+            g_scores[index] = g_score
+            parents[index] = parent
+            arrivals[index] = step_bit
+        elif g_score > current_g_score or arrivals[index] & step_bit:
+            return
+        else:
+            arrivals[index] |= step_bit
+        closed[index] = 0
+        index_h_score = h_score(index)
+        heapq.heappush(queue, (g_score + index_h_score, index_h_score, index))
+        counters[1] += 1
+
+    def jump_straight(index, step_number, g_score, weight, parent):
+        length = jump_length(index, step_number)
+        reach(index + steps[step_number][1] * length, g_score + weight * length, step_number, parent)
+
+    def jump_diagonal(index, step_number, g_score, weight):
+
+        # every open tile on the way carries on along both parts of the diagonal
+        length = jump_length(index, step_number)
+        step = steps[step_number][1]
+        for move in range(1, length):
+            for part_number in step_parts[step_number]:
+                jump_straight(index + step * move, part_number, g_score + weight * move, weight, index)
+        reach(index + step * length, g_score + weight * length, step_number, index)
+
+    g_scores[source] = 0
+    queue.append((0, 0, source))
+    reached = None
+    while queue:
+        f_score, index_h_score, index = heapq.heappop(queue)
+        if closed[index]:
+            continue
+        if index in goals:
+            reached = index
+            break
+        closed[index] = 1
+        counters[0] += 1
+
+        # open tiles carry on the moves that reached them, the rest (and the source) expand every neighbour
+        g_score = g_scores[index]
+        if open_tiles[index] and index != source:
+            weight = base_weights[index]
+            arrival_bits = arrivals[index]
+            for step_number in range(len(steps)):
+                if arrival_bits & (1 << step_number):
+                    if step_parts[step_number]:
+                        for part_number in step_parts[step_number]:
+                            jump_straight(index, part_number, g_score, weight, index)
+                        jump_diagonal(index, step_number, g_score, weight)
+                    else:
+                        jump_straight(index, step_number, g_score, weight, index)
+        else:
+            if index in override_indexes or index in static_indexes:
+                next_g_score = g_score + BLOCKED_TILE_WEIGHT
+            else:
+                next_g_score = g_score + base_weights[index]
+            move_bits = moves[index]
+            for step_number, (bit, step) in enumerate(steps):
+                if move_bits & bit and not closed[index + step]:
+                    reach(index + step, next_g_score, step_number, index)
+    count_search(stats, counters[0], counters[1])
+
+    # no way to any target
+    if reached is None:
+        return None, None
+
+    # walk back through the jump points, filling in the diagonal then straight moves between each pair
+    path = [reached]
+    while path[-1] != source:
+        index = path[-1]
+        parent = parents[index]
+        index_y, index_x = divmod(index, width)
+        parent_y, parent_x = divmod(parent, width)
+        d_x = index_x - parent_x
+        d_y = index_y - parent_y
+        diagonal_moves = min(abs(d_x), abs(d_y))
+        diagonal_step = (1 if d_y > 0 else -1) * width * (d_y != 0) + (1 if d_x > 0 else -1) * (d_x != 0)
+        straight_step = (1 if d_x > 0 else -1) if abs(d_x) > abs(d_y) else (1 if d_y > 0 else -1) * width
+        corner = parent + diagonal_step * diagonal_moves
+        tiles = [parent + diagonal_step * move for move in range(1, diagonal_moves + 1)] + \
+            [corner + straight_step * move for move in range(1, max(abs(d_x), abs(d_y)) - diagonal_moves + 1)]
+        path.extend(reversed(tiles[:-1]))
+        path.append(parent)
+    path.reverse()
+    return path, goals[reached]
+
+
+def bidirectional_search(grid, source, targets, cost_view, min_weight=None, stats=None, heuristic=None, radius=0):
+
+    # a* from the source and back from every goal tile at once, meeting on a path as cheap as astar_search's
+    if min_weight is None:
+        min_weight = cost_view.min_weight
+    base_weights = cost_view.base
+    static_indexes = cost_view.static_indexes
+    override_indexes = cost_view.override_indexes
+    width = grid.width
+    moves = grid.moves
+    steps = grid.steps
+    source_y, source_x = divmod(source, width)
+
+    goals = search_goals(grid, targets, cost_view, radius)
+    if source in goals:
+        return [source], goals[source]
+
+    h_score = search_heuristic(grid, targets, min_weight, heuristic, radius)
+
+    def potential(index):
+
+        # twice the forward potential (the backward one is its negative)
+        index_y, index_x = divmod(index, width)
+        d_x = abs(index_x - source_x)
+        d_y = abs(index_y - source_y)
+        return h_score(index) - (d_x if d_x > d_y else d_y) * min_weight
+
+    # flat g scores and parent pointers per half, -1 until a tile is reached
+    g_arrays = [np.full(grid.size, -1, dtype=np.int64), np.full(grid.size, -1, dtype=np.int64)]
+    parent_arrays = [np.full(grid.size, -1, dtype=np.int64), np.full(grid.size, -1, dtype=np.int64)]
+    g_scores = [memoryview(g_array) for g_array in g_arrays]
+    parents = [memoryview(parent_array) for parent_array in parent_arrays]
+    closed = [bytearray(grid.size), bytearray(grid.size)]
+    queues = [[(potential(source), source)], []]
+    g_scores[0][source] = 0
+    for goal in goals:
+        g_scores[1][goal] = 0
+        queues[1].append((-potential(goal), goal))
+    heapq.heapify(queues[1])
+
+    best_weight = None
+    meeting = None
+    expanded = 0
+    pushed = 1 + len(goals)
+    while queues[0] and queues[1]:
+        if best_weight is not None and queues[0][0][0] + queues[1][0][0] >= 2 * best_weight:
+            break
+
+        # expand whichever half has the smaller key
+        half = 0 if queues[0][0][0] <= queues[1][0][0] else 1
+        key, index = heapq.heappop(queues[half])
+        if closed[half][index]:
+            continue
+        closed[half][index] = 1
+        expanded += 1
+        half_g_scores = g_scores[half]
+        other_g_scores = g_scores[1 - half]
+        half_parents = parents[half]
+        half_queue = queues[half]
+
+        if half == 0:
+            if index in override_indexes or index in static_indexes:
+                leave_weight = BLOCKED_TILE_WEIGHT
+            else:
+                leave_weight = base_weights[index]
+        move_bits = moves[index]
+        for bit, step in steps:
+            if move_bits & bit:
+                neighbour = index + step
+                if closed[half][neighbour]:
+                    continue
+
+                # forwards a move costs this tile, backwards it costs the neighbour we'd be leaving from
+                if half == 1:
+                    if neighbour in override_indexes or neighbour in static_indexes:
+                        leave_weight = BLOCKED_TILE_WEIGHT
+                    else:
+                        leave_weight = base_weights[neighbour]
+                g_score = half_g_scores[index] + leave_weight
+                neighbour_g_score = half_g_scores[neighbour]
+                if neighbour_g_score < 0 or g_score < neighbour_g_score:
+                    half_g_scores[neighbour] = g_score
+                    half_parents[neighbour] = index
+                    neighbour_potential = potential(neighbour)
+                    heapq.heappush(half_queue, (2 * g_score + (neighbour_potential if half == 0 else -neighbour_potential),
+                                                neighbour))
+                    pushed += 1
+
+                    # a tile the other half has reached joins up a whole path
+                    if other_g_scores[neighbour] >= 0:
+                        path_weight = g_score + other_g_scores[neighbour]
+                        if best_weight is None or path_weight < best_weight:
+                            best_weight = path_weight
+                            meeting = neighbour
+    count_search(stats, expanded, pushed)
+
+    # no way to any target
+    if meeting is None:
+        return None, None
+
+    # forward parents back to the source, then backward parents on to the goal tile
+    path = [meeting]
+    while path[-1] != source:
+        path.append(parents[0][path[-1]])
+    path.reverse()
+    while path[-1] not in goals or g_scores[1][path[-1]] != 0:
+        path.append(parents[1][path[-1]])
+    return path, goals[path[-1]]
+
+
+def compiled_astar_search(grid, source, targets, cost_view, min_weight=None, stats=None, heuristic=None, radius=0,
+                          backend='numba'):
+
+    # astar_search through the array kernel (compiled by numba unless asked for the python backend), same path
+    if min_weight is None:
+        min_weight = cost_view.min_weight
+    blocked = np.zeros(grid.size, dtype=np.uint8)
+    blocked_indexes = cost_view.static_indexes | cost_view.override_indexes
+    blocked[np.fromiter(blocked_indexes, dtype=np.int64, count=len(blocked_indexes))] = 1
+
+    goals = search_goals(grid, targets, cost_view, radius)
+    goal_numbers = np.full(grid.size, -1, dtype=np.int64)
+    goal_numbers[list(goals)] = list(goals.values())
+    target_ys, target_xs = np.divmod(np.asarray(targets, dtype=np.int64), grid.width)
+
+    step_bits = np.array([bit for bit, step in grid.steps], dtype=np.int64)
+    step_offsets = np.array([step for bit, step in grid.steps], dtype=np.int64)
+    heuristic = np.zeros(0, dtype=np.int64) if heuristic is None else np.asarray(heuristic, dtype=np.int64)
+    path, target_number, expanded, pushed = kernel(astar_kernel, backend)(
+        np.asarray(cost_view.base), blocked, grid.move_array, step_bits, step_offsets, grid.width, source, goal_numbers,
+        target_ys, target_xs, radius, min_weight, heuristic, BLOCKED_TILE_WEIGHT)
+    count_search(stats, expanded, pushed)
+
+    # no way to any target
+    if len(path) == 0:
+        return None, None
+    return path.tolist(), int(target_number)
+
+
+# grid searches by name (all take and return the same things as astar_search) and the ones with a compiled kernel
+PATH_SEARCHES = {
+    'astar': astar_search,
+    'jump_point': jump_point_search,
+    'bidirectional': bidirectional_search,
+}
+COMPILED_PATH_SEARCHES = {
+    'astar': compiled_astar_search,
+}
+
+
+class ReservationTable:
+
+    # tiles taken at each tick, by committed claims and by moving objects (looked up a tick at a time, the first
+    # time a search asks about that tick)
+    def __init__(self, movers=()):
+        self.movers = list(movers)
+        self.claims = {}
+        self.parked = {}
+        self.occupied = {}
+
+    def mover_nodes(self, tick):
+        if tick not in self.occupied:
+            nodes = set()
+            for mover in self.movers:
+                if mover.alive(tick):
+                    location = mover.location(tick)
+                    if location is not None:
+                        nodes.add(location.node)
+            self.occupied[tick] = nodes
+        return self.occupied[tick]
+
+    def reserved(self, node, tick):
+        if node in self.parked and tick >= self.parked[node]:
+            return True
+        return node in self.mover_nodes(tick) or node in self.claims.get(tick, ())
+
+    def claim(self, node, tick):
+        self.claims.setdefault(tick, set()).add(node)
+
+    def path_reserved(self, nodes, path_ticks):
+
+        # whether anything else is on a tile while the path holds it (the start tile is already ours)
+        hold_ticks = [range(tick, next_tick) for tick, next_tick in zip(path_ticks[1:], path_ticks[2:])]
+        hold_ticks.append(range(path_ticks[-1], path_ticks[-1] + 1))
+        return any([self.reserved(node, hold_tick) for node, ticks in zip(nodes[1:], hold_ticks) for hold_tick in ticks])
+
+    def park(self, node, tick):
+
+        # taken from this tick on (a creep that stays where its path ends)
+        self.parked[node] = min(tick, self.parked.get(node, tick))
+
+    def claim_path(self, nodes, path_ticks):
+
+        # each tile is held from the tick the creep arrives until it arrives on the next one, the last for good
+        for node, tick, next_tick in zip(nodes, path_ticks, path_ticks[1:]):
+            for hold_tick in range(tick, next_tick):
+                self.claim(node, hold_tick)
+        self.park(nodes[-1], path_ticks[-1])
+
+
+def move_ticks(terrain_cost, fatigue_per_move, fatigue_recovery):
+
+    # ticks from starting a move onto a tile until the creep can move again (the fatigue it picks up
+    # there less one tick of recovery, then whole ticks of recovery)
+    fatigue = terrain_cost * fatigue_per_move - fatigue_recovery
+    if fatigue <= 0:
+        return 1
+    return 1 + -(-fatigue // fatigue_recovery)
+
+
+class TickField:
+
+    # fewest ticks from every tile of a window until a creep with this body arrives within radius of the target
+    # (-1 where it can't) and the tile it moves to next, from one dijkstra over the reversed graph, moving onto a
+    # tile takes its move ticks except the last move which only takes the tick to arrive, walls and blocked tiles
+    # can't be entered other than the target itself
+    def __init__(self, grid, target, cost_view, fatigue_per_move, fatigue_recovery, radius=0):
+        self.grid = grid
+        self.target = target
+        fatigue = grid.cost_array.astype(np.int64) * fatigue_per_move - fatigue_recovery
+        tile_ticks = np.where(fatigue <= 0, 1, 1 + -(-fatigue // max(1, fatigue_recovery)))
+        enterable = grid.cost_array < 255
+        enterable[np.fromiter(cost_view.static_indexes | cost_view.override_indexes, dtype=np.int64)] = False
+        enterable[target] = True
+        goals = np.zeros(grid.size, dtype=bool)
+        goals[goal_indexes(grid, target, radius)] = True
+
+        adjacency, edge_sources = grid.adjacency_structure()
+        edge_targets = adjacency.indices
+        edge_ticks = np.where(goals[edge_targets], 1, tile_ticks[edge_targets])
+        kept = enterable[edge_targets]
+        graph = csr_matrix((edge_ticks[kept], (edge_targets[kept], edge_sources[kept])), shape=(grid.size, grid.size))
+        ticks, predecessors, _ = dijkstra(graph, directed=True, indices=np.flatnonzero(goals & enterable),
+                                          min_only=True, return_predecessors=True)
+        self.tick_array = np.where(np.isfinite(ticks), ticks, -1).astype(np.int64)
+        self.next_array = predecessors.astype(np.int64)
+        self.ticks = memoryview(self.tick_array)
+        self.next_indexes = memoryview(self.next_array)
+
+    def path(self, source, start_tick):
+
+        # follow the next tiles down to the goal, arriving a tick after the creep is ready to leave each one
+        if self.ticks[source] < 0:
+            return None, None
+        path = [source]
+        path_ticks = [start_tick]
+        index = source
+        while self.ticks[index] > 0:
+            ready_tick = start_tick + self.ticks[source] - self.ticks[index]
+            index = self.next_indexes[index]
+            path.append(index)
+            path_ticks.append(ready_tick + 1)
+        return path, path_ticks
+
+
+def space_time_path(grid, source, target, start_tick, cost_view, reservations, fatigue_per_move, fatigue_recovery,
+                    radius=0, max_tick=None, max_expanded=None, stats=None, tick_field=None):
+
+    # a* over (tile, tick) states where the tick is when the creep can next move, it can wait a tick or move
+    # (picking up fatigue from the terrain it moves onto) as long as nothing has claimed the tile on the
+    # ticks it would be there, walls and blocked tiles can't be entered other than at the target
+    moves = grid.moves
+    steps = grid.steps
+    terrain_costs = grid.cost
+    blocked_indexes = cost_view.static_indexes | cost_view.override_indexes
+    if max(abs(a - b) for a, b in zip(grid.node(source), grid.node(target))) <= radius:
+        return [source], [start_tick]
+    if fatigue_recovery <= 0 and fatigue_per_move > 0:
+        return None, None
+
+    # ticks to the goal ignoring everyone else never overestimate (and prune tiles that can't reach it)
+    if tick_field is None:
+        tick_field = TickField(grid, target, cost_view, fatigue_per_move, fatigue_recovery, radius)
+    remaining_ticks = tick_field.ticks
+    if remaining_ticks[source] < 0:
+        return None, None
+
+    # queue entries are (priority, tick, tile, 0, None) or, once a goal tile is reached,
+    # (arrival, arrival, tile, 1, state) so the earliest arrival comes off first
+    parents = {(source, start_tick): None}
+    closed = set()
+    queue = [(start_tick + remaining_ticks[source], start_tick, source, 0, None)]
+    expanded = 0
+    reached = None
+    while queue:
+        f_score, tick, index, terminal, state = heapq.heappop(queue)
+        if terminal:
+            reached = state
+            break
+        if max_expanded is not None and expanded >= max_expanded:
+            break
+        if (index, tick) in closed or (max_tick is not None and tick >= max_tick):
+            continue
+        closed.add((index, tick))
+        expanded += 1
+
+        # wait a tick where we are
+        if (index, tick + 1) not in parents and not reservations.reserved(grid.node(index), tick + 1):
+            parents[(index, tick + 1)] = (index, tick)
+            heapq.heappush(queue, (tick + 1 + remaining_ticks[index], tick + 1, index, 0, None))
+
+        # or move, staying on the new tile until the fatigue is gone
+        move_bits = moves[index]
+        for bit, step in steps:
+            if move_bits & bit:
+                neighbour = index + step
+                neighbour_remaining_ticks = remaining_ticks[neighbour]
+                if neighbour_remaining_ticks < 0 or \
+                        (neighbour != target and (terrain_costs[neighbour] >= 255 or neighbour in blocked_indexes)):
+                    continue
+                ready_tick = tick + move_ticks(terrain_costs[neighbour], fatigue_per_move, fatigue_recovery)
+                if (neighbour, ready_tick) in parents:
+                    continue
+                neighbour_node = grid.node(neighbour)
+                if any([reservations.reserved(neighbour_node, hold_tick) for hold_tick in range(tick + 1, ready_tick + 1)]):
+                    continue
+                parents[(neighbour, ready_tick)] = (index, tick)
+                if neighbour_remaining_ticks == 0:
+                    heapq.heappush(queue, (tick + 1, tick + 1, neighbour, 1, (neighbour, ready_tick)))
+                else:
+                    heapq.heappush(queue, (ready_tick + neighbour_remaining_ticks, ready_tick, neighbour, 0, None))
+
+    if stats is not None:
+        stats['space_time_searches'] = stats.get('space_time_searches', 0) + 1
+        stats['space_time_expanded'] = stats.get('space_time_expanded', 0) + expanded
+    if reached is None:
+        return None, None
+
+    # walk back through the states, keeping the moves and the tick each one arrived
+    path = []
+    path_ticks = []
+    state = reached
+    while parents[state] is not None:
+        previous_state = parents[state]
+        if previous_state[0] != state[0]:
+            path.append(state[0])
+            path_ticks.append(previous_state[1] + 1)
+        state = previous_state
+    path.append(source)
+    path_ticks.append(start_tick)
+    path.reverse()
+    path_ticks.reverse()
+    return path, path_ticks
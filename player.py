@@ -83,7 +83,7 @@ class Player:
                                                                   world=self.world, player=self)
 
         # update world objects
-        self.world.game_objects.update(game_objects)
+        self.world.add_game_objects(game_objects)
 
         # grab existing tasks
         self.tasks = raw_memory['tasks']
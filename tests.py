@@ -1,10 +1,27 @@
 import unittest
 import world
+import pathfinding
+import screeps_utilities
 import director
 import player
 import game_objects
+import kernels
 import pickle
 import constants
+import http.server
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import types
+import urllib.parse
+import multiprocessing
+import scipy.sparse
+import scipy.sparse.csgraph
+import numpy as np
+from unittest import mock
 
 # logging
 import logging
@@ -25,6 +42,7 @@ class TestPointMethods(unittest.TestCase):
         self.assertEqual(point.js_x_y, {'x': 1, 'y': 47})
         self.assertEqual(point.edge_type, None)
         self.assertEqual(point.terrain, 255)
+        self.assertFalse(point.exit_tile)
 
     def testPointFromSnapshotJson(self):
         point = self.world.point(snapshot_json={'room_name': 'W7N7', 'x': 22, 'y': 13})
@@ -34,6 +52,7 @@ class TestPointMethods(unittest.TestCase):
         self.assertEqual(point.js_x_y, {'x': 22, 'y': 13})
         self.assertEqual(point.edge_type, None)
         self.assertEqual(point.terrain, 255)
+        self.assertFalse(point.exit_tile)
 
     def testPointEdgeCase(self):
         point = self.world.point(snapshot_json={'room_name': 'W10N1', 'x': 49, 'y': 33})
@@ -42,7 +61,8 @@ class TestPointMethods(unittest.TestCase):
         self.assertEqual(point.room.js_room_name, 'W10N1')
         self.assertEqual(point.js_x_y, {'x': 49, 'y': 33})
         self.assertEqual(point.edge_type, 'E')
-        self.assertEqual(point.terrain, 255.4)
+        self.assertEqual(point.terrain, 255)
+        self.assertTrue(point.exit_tile)
 
     def testPath1(self):
         from_point = self.world.point(snapshot_json={'room_name': 'W2N2', 'x': 22, 'y': 18})
@@ -83,6 +103,953 @@ class TestGameObjectMethods(unittest.TestCase):
         self.assertEqual(self.director.players[0].tasks[8225]['spawn-W7N7-20-11']['type'], 'wait')
 
 
+# fake screeps server for terrain tests
+def fake_room_terrain_string(room_name):
+
+    # random walls and swamps with walled edges that open up in the middle of each side
+    rng = random.Random(room_name)
+    terrain_characters = []
+    for terrain_index in range(0, 2500):
+        row, col = divmod(terrain_index, 50)
+        if row in [0, 49] or col in [0, 49]:
+            edge_position = col if row in [0, 49] else row
+            terrain_characters.append('0' if 20 <= edge_position <= 29 else '1')
+        else:
+            roll = rng.random()
+            terrain_characters.append('1' if roll < .1 else '2' if roll < .25 else '0')
+    return ''.join(terrain_characters)
+
+
+class FakeTerrainHandler(http.server.BaseHTTPRequestHandler):
+
+    requested_rooms = []
+    changed_rooms = {}
+
+    def do_POST(self):
+        self.send_json({'ok': 1, 'token': 'fake'})
+
+    def do_GET(self):
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        room_name = query['room'][0]
+        FakeTerrainHandler.requested_rooms.append(room_name)
+        terrain_string = FakeTerrainHandler.changed_rooms.get(room_name, fake_room_terrain_string(room_name))
+        self.send_json({'ok': 1, 'terrain': [{'room': room_name, 'terrain': terrain_string, 'type': 'terrain'}]})
+
+    def send_json(self, body):
+        encoded_body = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(encoded_body)))
+        self.end_headers()
+        self.wfile.write(encoded_body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        # serve terrain from a local fake endpoint
+        FakeTerrainHandler.requested_rooms = []
+        FakeTerrainHandler.changed_rooms = {}
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FakeTerrainHandler)
+        self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.server_thread.start()
+
+        # keep all caches out of the real data directory
+        self.data_directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.data_directory)
+
+    def make_world(self, bottom_left_room='W1N0', top_right_room='W0N1', shared_terrain=None, **world_options):
+
+        # write a config pointed at the fake server
+        config_file_location = os.path.join(self.data_directory, 'fake_server.config')
+        with open(config_file_location, 'w') as handle:
+            handle.write('[CONNECTION]\nuser = player_1\npassword = fake\n')
+            handle.write(f'host = 127.0.0.1:{self.server.server_address[1]}\n\n')
+            handle.write(f'[WORLD]\nbottom_left_room = {bottom_left_room}\ntop_right_room = {top_right_room}\n')
+            handle.write(f'shard = shard3\ndata_directory = {self.data_directory}\n')
+            for option, value in world_options.items():
+                handle.write(f'{option} = {value}\n')
+
+        return world.World(config_file_location=config_file_location, shared_terrain=shared_terrain)
+
+
+# terrain decoding
+class TestTerrainDecode(FakeServerTestCase):
+
+    def testRoomBlock(self):
+        terrain_string = ''.join(['0123'[terrain_index % 4] for terrain_index in range(0, 2500)])
+        terrain_block = world.terrain_block_from_string(terrain_string)
+        self.assertEqual(terrain_block.dtype, np.uint8)
+        self.assertEqual(terrain_block.shape, (50, 50))
+
+        # the first character is the top left of the room, block row 0 is the bottom
+        for terrain_index in [0, 1, 2, 3, 49, 50, 1234, 2499]:
+            row, col = divmod(terrain_index, 50)
+            self.assertEqual(terrain_block[49 - row, col], [2, 255, 10, 255][terrain_index % 4])
+
+    def testCostAndExitLayers(self):
+        test_world = self.make_world()
+        self.assertEqual(test_world.terrain.terrain_matrix.dtype, np.uint8)
+        self.assertEqual(test_world.terrain.exit_bits.shape, (100, 13))
+
+        # costs come straight from the strings and the packed bits mark the room edges
+        for room_name in ['W1N0', 'W0N1']:
+            room = world.Room(room_name=room_name, world=test_world)
+            terrain_string = fake_room_terrain_string(room_name)
+            for terrain_index in range(0, 2500, 7):
+                point = room.point_from_terrain_index(terrain_index)
+                point.world = test_world
+                self.assertEqual(point.terrain, {'0': 2, '1': 255, '2': 10}[terrain_string[terrain_index]])
+                self.assertEqual(point.exit_tile, point.edge_type is not None)
+
+
+# scaled search weights
+class TestPathWeights(unittest.TestCase):
+
+    def testScaledWeights(self):
+        cost = np.array([[2, 10, 255], [10, 2, 2], [2, 255, 10]], dtype=np.uint8)
+        exits = np.zeros((3, 3), dtype=bool)
+        exits[0, :] = True
+        grid = pathfinding.SearchGrid(cost, exits)
+
+        # tenths of a tile cost, exit tiles keep their terrain and add the penalty
+        weights, min_weight = grid.base_weights()
+        self.assertEqual(weights.reshape(3, 3).tolist(), [[24, 104, 2554], [100, 20, 20], [20, 2550, 100]])
+        self.assertEqual(min_weight, 2 * pathfinding.PATH_WEIGHT_SCALE)
+        self.assertEqual(pathfinding.EXIT_TILE_WEIGHT, pathfinding.EXIT_TILE_PENALTY * pathfinding.PATH_WEIGHT_SCALE)
+        ignored_weights, ignored_min_weight = grid.base_weights(ignore_terrain_differences=True)
+        self.assertEqual(ignored_weights.reshape(3, 3).tolist(), [[24, 104, 2554], [20, 20, 20], [20, 2550, 20]])
+        self.assertEqual(ignored_min_weight, 20)
+
+        # distances come back in tile costs with the penalty exact, blocked tiles cost a wall
+        graph = grid.csr_adjacency(weights)
+        self.assertEqual(pathfinding.distance_matrix(graph, [0, 4], [4, 5]).tolist(), [[2.4, 4.4], [0, 2]])
+        self.assertEqual(pathfinding.CostView(grid, override_indexes={4}).weight(4), pathfinding.BLOCKED_TILE_WEIGHT)
+        self.assertEqual(pathfinding.CostView(grid).weight(4), 20)
+
+
+# terrain fetching
+class TestTerrainFetch(FakeServerTestCase):
+
+    def testConcurrentFetch(self):
+        test_world = self.make_world(terrain_fetch_workers=4, terrain_checkpoint_rooms=2)
+        self.assertEqual(sorted(FakeTerrainHandler.requested_rooms), ['W0N0', 'W0N1', 'W1N0', 'W1N1'])
+
+        # terrain made it into the world the right way up
+        terrain_string = fake_room_terrain_string('W0N1')
+        point = test_world.point(snapshot_json={'room_name': 'W0N1', 'x': 17, 'y': 6})
+        self.assertEqual(point.terrain, {'0': 2, '1': 255, '2': 10}[terrain_string[6 * 50 + 17]])
+
+        # checkpointed strings are reused on the next start
+        FakeTerrainHandler.requested_rooms = []
+        os.remove(test_world.terrain.terrain_store_path)
+        self.make_world()
+        self.assertEqual(FakeTerrainHandler.requested_rooms, [])
+
+    def testFetchProgress(self):
+        test_world = self.make_world()
+        rooms = [world.Room(room_name=room_name, world=test_world) for room_name in ['W2N0', 'W2N1', 'W3N0']]
+        progress = []
+        fetched_rooms = test_world.terrain.fetch_missing_room_terrain(
+            rooms, progress_callback=lambda done, total: progress.append((done, total)))
+        self.assertEqual(fetched_rooms, 3)
+        self.assertEqual(progress, [(1, 3), (2, 3), (3, 3)])
+        self.assertEqual(test_world.terrain.fetch_missing_room_terrain(rooms), 0)
+
+
+# lazily loaded terrain tiles
+class TestTiledTerrain(FakeServerTestCase):
+
+    def testMatchesDense(self):
+        dense_world = self.make_world()
+        tiled_world = self.make_world(terrain_backend='tiled')
+        self.assertIsNone(tiled_world.terrain.terrain_matrix)
+        self.assertEqual(len(tiled_world.terrain.tiles), 0)
+
+        # the same costs and exits everywhere, in the same global coordinates
+        height, width = dense_world.terrain.shape
+        for y in range(0, height):
+            for x in range(0, width, 3):
+                self.assertEqual(tiled_world.terrain.cost(x, y), dense_world.terrain.cost(x, y))
+                self.assertEqual(tiled_world.terrain.is_exit(x, y), dense_world.terrain.is_exit(x, y))
+        for dense_layer, tiled_layer in zip(dense_world.terrain.window(0, 0, 2, 2), tiled_world.terrain.window(0, 0, 2, 2)):
+            self.assertTrue((dense_layer == tiled_layer).all())
+
+        # and the same paths
+        for from_room_name, to_room_name in [('W1N0', 'W0N1'), ('W0N0', 'W1N1'), ('W1N0', 'W1N0')]:
+            from_point, to_point = [(test_world.point(snapshot_json={'room_name': from_room_name, 'x': 25, 'y': 25}),
+                                     test_world.point(snapshot_json={'room_name': to_room_name, 'x': 10, 'y': 40}))
+                                    for test_world in [dense_world, tiled_world]]
+            self.assertEqual(tiled_world.path_between(*to_point), dense_world.path_between(*from_point))
+
+    def testRefresh(self):
+        tiled_world = self.make_world(terrain_backend='tiled')
+        point = tiled_world.point(snapshot_json={'room_name': 'W1N1', 'x': 10, 'y': 10})
+        point.terrain
+        self.assertEqual(tiled_world.terrain.refresh_terrain(), [])
+
+        # a changed room is dropped and loaded again on its next access
+        FakeTerrainHandler.changed_rooms['W1N1'] = '2' * 2500
+        changed_rooms = tiled_world.terrain.refresh_terrain()
+        self.assertEqual([room.js_room_name for room in changed_rooms], ['W1N1'])
+        self.assertEqual(tiled_world.terrain.version, 1)
+        self.assertEqual(point.terrain, 10)
+        self.assertEqual(self.make_world().point(snapshot_json={'room_name': 'W1N1', 'x': 10, 'y': 10}).terrain, 10)
+
+    def testEviction(self):
+        dense_world = self.make_world()
+        tiled_world = self.make_world(terrain_backend='tiled', terrain_memory_budget_mb=0.005)
+        tiles = tiled_world.terrain.tiles
+        self.assertEqual(tiles.max_tiles, 2)
+
+        # touching every room keeps the two most recently used ones
+        room_points = [tiled_world.point(snapshot_json={'room_name': room_name, 'x': 17, 'y': 33})
+                       for room_name in ['W1N0', 'W0N0', 'W1N1', 'W0N1']]
+        for room_point in room_points:
+            self.assertEqual(room_point.terrain, dense_world.terrain.cost(room_point.x, room_point.y))
+        self.assertEqual((len(tiles), tiles.loads, tiles.evictions), (2, 4, 2))
+        self.assertEqual(list(tiles.tiles), [(1, 0), (1, 1)])
+
+        # evicted rooms load again, and windows bigger than the budget still stitch together
+        self.assertEqual(room_points[0].terrain, dense_world.terrain.cost(room_points[0].x, room_points[0].y))
+        self.assertEqual((tiles.loads, tiles.evictions), (5, 3))
+        self.assertTrue((tiled_world.terrain.window(0, 0, 2, 2)[0] == dense_world.terrain.window(0, 0, 2, 2)[0]).all())
+        self.assertEqual(len(tiles), 2)
+
+
+# memory mapped terrain store
+class TestTerrainStore(FakeServerTestCase):
+
+    def testStoreHeader(self):
+        terrain = self.make_world().terrain
+        with open(terrain.terrain_store_path, 'rb') as handle:
+            header = handle.read(world.TERRAIN_STORE_HEADER_SIZE)
+        self.assertEqual(world.TERRAIN_STORE_HEADER.unpack_from(header),
+                         (world.TERRAIN_STORE_MAGIC, world.TERRAIN_STORE_VERSION,
+                          terrain.bottom_left_room_js_row_col['row'], terrain.bottom_left_room_js_row_col['col'], 2, 2))
+        self.assertEqual(os.path.getsize(terrain.terrain_store_path), world.TERRAIN_STORE_HEADER_SIZE + 100 * 100 + 100 * 13)
+
+        # the next start maps the store read only without decoding anything
+        with mock.patch('world.terrain_block_from_string', wraps=world.terrain_block_from_string) as decoder:
+            mapped_terrain = self.make_world().terrain
+        self.assertEqual(decoder.call_count, 0)
+        self.assertIsInstance(mapped_terrain.terrain_matrix, np.memmap)
+        self.assertFalse(mapped_terrain.terrain_matrix.flags.writeable)
+        self.assertTrue((mapped_terrain.terrain_matrix == terrain.terrain_matrix).all())
+
+    def testStoreRejected(self):
+        terrain = self.make_world().terrain
+        terrain_matrix = np.array(terrain.terrain_matrix)
+        with open(terrain.terrain_store_path, 'rb') as handle:
+            store_bytes = handle.read()
+        header = list(world.TERRAIN_STORE_HEADER.unpack_from(store_bytes))
+
+        # another magic, another version or a cut off header is treated as no store and rebuilt
+        for magic, version in [(b'NOTTRRN!', world.TERRAIN_STORE_VERSION),
+                               (world.TERRAIN_STORE_MAGIC, world.TERRAIN_STORE_VERSION + 1), (None, None)]:
+            with open(terrain.terrain_store_path, 'wb') as handle:
+                if magic is None:
+                    handle.write(store_bytes[:world.TERRAIN_STORE_HEADER_SIZE // 2])
+                else:
+                    handle.write(world.TERRAIN_STORE_HEADER.pack(magic, version, *header[2:]))
+                    handle.write(store_bytes[world.TERRAIN_STORE_HEADER.size:])
+            self.assertIsNone(terrain.read_terrain_store())
+            with mock.patch('world.terrain_block_from_string', wraps=world.terrain_block_from_string) as decoder:
+                rebuilt_terrain = self.make_world().terrain
+            self.assertEqual(decoder.call_count, 4)
+            self.assertTrue((rebuilt_terrain.terrain_matrix == terrain_matrix).all())
+            self.assertIsNotNone(rebuilt_terrain.read_terrain_store())
+
+
+# per room terrain cache
+class TestTerrainCache(FakeServerTestCase):
+
+    def testWorldBoundsChange(self):
+        small_world = self.make_world()
+        small_terrain = small_world.terrain.terrain_matrix.copy()
+
+        # growing the world only decodes the new rooms
+        with mock.patch('world.terrain_block_from_string', wraps=world.terrain_block_from_string) as decoder:
+            large_world = self.make_world(bottom_left_room='W2N0')
+        self.assertEqual(decoder.call_count, 2)
+        self.assertTrue((large_world.terrain.terrain_matrix[:, 50:] == small_terrain).all())
+        self.assertEqual(sorted(large_world.terrain.room_hashes), ['W0N0', 'W0N1', 'W1N0', 'W1N1', 'W2N0', 'W2N1'])
+
+    def testRefresh(self):
+        test_world = self.make_world()
+
+        # nothing changed on the server
+        self.assertEqual(test_world.terrain.refresh_terrain(), [])
+
+        # only the changed room is decoded again
+        FakeTerrainHandler.changed_rooms['W1N1'] = '0' * 2500
+        changed_rooms = test_world.terrain.refresh_terrain()
+        self.assertEqual([room.js_room_name for room in changed_rooms], ['W1N1'])
+        self.assertEqual(test_world.point(snapshot_json={'room_name': 'W1N1', 'x': 10, 'y': 10}).terrain, 2)
+
+        # and the refreshed store is picked up on the next start
+        self.assertEqual(self.make_world().point(snapshot_json={'room_name': 'W1N1', 'x': 0, 'y': 0}).terrain, 2)
+
+
+# shared memory terrain
+def shared_terrain_worker(config_file_location, shared_terrain, room_name):
+    worker_world = world.World(config_file_location=config_file_location, shared_terrain=shared_terrain)
+    point = worker_world.point(snapshot_json={'room_name': room_name, 'x': 25, 'y': 25})
+    return point.terrain, worker_world.terrain.terrain_matrix.flags.writeable
+
+
+class TestSharedTerrain(FakeServerTestCase):
+
+    def testWorkerAttach(self):
+        test_world = self.make_world()
+        shared_terrain = test_world.publish_shared_terrain()
+        try:
+            expected_terrain = test_world.point(snapshot_json={'room_name': 'W1N1', 'x': 25, 'y': 25}).terrain
+            config_file_location = os.path.join(self.data_directory, 'fake_server.config')
+            with multiprocessing.get_context('fork').Pool(2) as pool:
+                results = pool.starmap(shared_terrain_worker, [(config_file_location, shared_terrain, 'W1N1')] * 2)
+            self.assertEqual(results, [(expected_terrain, False)] * 2)
+        finally:
+            test_world.close_shared_terrain()
+        self.assertEqual(test_world.point(snapshot_json={'room_name': 'W1N1', 'x': 25, 'y': 25}).terrain, expected_terrain)
+
+    def testBoundsMismatch(self):
+        test_world = self.make_world()
+        shared_terrain = test_world.publish_shared_terrain()
+        try:
+
+            # a world with other bounds loads its own terrain, building a store when there's none yet
+            os.remove(test_world.terrain.terrain_store_path)
+            wide_world = self.make_world(bottom_left_room='W2N0', shared_terrain=shared_terrain)
+            self.assertEqual(wide_world.terrain.terrain_matrix.shape, (100, 150))
+            self.assertEqual(wide_world.terrain.shared_memory_blocks, [])
+            point = wide_world.point(snapshot_json={'room_name': 'W2N1', 'x': 17, 'y': 6})
+            self.assertEqual(point.terrain, {'0': 2, '1': 255, '2': 10}[fake_room_terrain_string('W2N1')[6 * 50 + 17]])
+
+            # and never maps a store built for other bounds
+            wider_world = self.make_world(bottom_left_room='W3N0', shared_terrain=shared_terrain)
+            self.assertEqual(wider_world.terrain.terrain_matrix.shape, (100, 200))
+        finally:
+            test_world.close_shared_terrain()
+
+
+# implicit grid links
+class TestSearchGrid(FakeServerTestCase):
+
+    def testExitLinks(self):
+        test_world = self.make_world()
+        grid = test_world.search_grid()
+        edge_types = dict([((x, y), test_world.point(x=x, y=y).edge_type)
+                           for x in range(grid.width) for y in range(grid.height)])
+
+        # the old graph's linkage logic: north/south edge tiles don't move sideways onto an edge tile, east/west ones
+        # (corners included) don't move up or down onto one, and a link exists if either end allows it
+        old_links = set()
+        for (x, y), edge_type in edge_types.items():
+            for d_x, d_y in pathfinding.DIRECTION_DELTAS:
+                end_edge_type = edge_types.get((x + d_x, y + d_y), 'outside')
+                if end_edge_type == 'outside':
+                    continue
+                if edge_type in ['N', 'S'] and end_edge_type is not None and d_x != 0:
+                    continue
+                if edge_type in ['E', 'W'] and end_edge_type is not None and d_y != 0:
+                    continue
+                old_links.update([((x, y), (x + d_x, y + d_y)), ((x + d_x, y + d_y), (x, y))])
+
+        links = set([(grid.node(index), grid.node(neighbour))
+                     for index in range(grid.size) for neighbour in grid.neighbours(index)])
+        self.assertEqual(links, old_links)
+
+
+# path weight of a path found by path_between (the cost of each tile being left)
+def path_weight(test_world, path):
+    weight = 0
+    for x, y in path[:-1]:
+        point = test_world.point(x=x, y=y)
+        weight += point.terrain + (pathfinding.EXIT_TILE_PENALTY if point.exit_tile else 0)
+    return weight
+
+
+class TestBulkDistances(FakeServerTestCase):
+
+    def testDistanceMatrix(self):
+        test_world = self.make_world()
+        from_points = [test_world.point(snapshot_json={'room_name': 'W1N0', 'x': 25, 'y': 25}),
+                       test_world.point(snapshot_json={'room_name': 'W0N1', 'x': 10, 'y': 40})]
+        to_points = [test_world.point(snapshot_json={'room_name': 'W0N0', 'x': 30, 'y': 20}),
+                     test_world.point(snapshot_json={'room_name': 'W1N1', 'x': 15, 'y': 35}),
+                     from_points[0]]
+
+        # csgraph distances agree with the single pair search
+        distances = test_world.distance_matrix(from_points, to_points)
+        self.assertEqual(distances.shape, (2, 3))
+        for from_index, from_point in enumerate(from_points):
+            for to_index, to_point in enumerate(to_points):
+                expected = path_weight(test_world, test_world.path_between(from_point, to_point))
+                self.assertAlmostEqual(distances[from_index, to_index], expected)
+        self.assertTrue((test_world.distances_from(from_points[1], to_points) == distances[1]).all())
+
+    def testSaveAdjacency(self):
+        test_world = self.make_world()
+        path = test_world.save_csr_adjacency()
+        graph = scipy.sparse.load_npz(path)
+        self.assertEqual(graph.shape, (test_world.terrain.shape[0] * test_world.terrain.shape[1],) * 2)
+        self.assertEqual(os.path.dirname(path), self.data_directory)
+
+
+class TestPathSearch(FakeServerTestCase):
+
+    def testHeuristicExpansions(self):
+        test_world = self.make_world()
+        from_point = test_world.point(snapshot_json={'room_name': 'W1N0', 'x': 25, 'y': 25})
+        to_point = test_world.point(snapshot_json={'room_name': 'W0N1', 'x': 25, 'y': 25})
+        path = test_world.path_between(from_point, to_point)
+
+        # same cost as a dijkstra over the same weights, with fewer expansions
+        grid = test_world.search_grid(from_point, to_point)
+        dijkstra_stats = {}
+        dijkstra_path = pathfinding.astar_path(grid, grid.index(from_point.x, from_point.y), grid.index(to_point.x, to_point.y),
+                                               pathfinding.CostView(grid), 0, dijkstra_stats)
+        self.assertEqual(path[0], from_point.node)
+        self.assertEqual(path[-1], to_point.node)
+        self.assertAlmostEqual(path_weight(test_world, path), path_weight(test_world, [grid.node(index) for index in dijkstra_path]))
+        self.assertLess(test_world.path_search_stats['expanded'], dijkstra_stats['expanded'])
+
+    def testCostViewLayers(self):
+        test_world = self.make_world()
+        from_point = test_world.point(snapshot_json={'room_name': 'W1N0', 'x': 25, 'y': 25})
+        to_point = test_world.point(snapshot_json={'room_name': 'W0N1', 'x': 25, 'y': 25})
+        path = test_world.path_between(from_point, to_point)
+
+        # layered weights match a stamped copy, and the base layer is never written
+        grid = test_world.search_grid(from_point, to_point)
+        bad_indexes = set([grid.index(x, y) for x, y in path[1:-1]])
+        for ignore_terrain_differences in [False, True]:
+            cost_view = pathfinding.CostView(grid, ignore_terrain_differences, override_indexes=bad_indexes)
+            weights = grid.tile_weights(bad_indexes, ignore_terrain_differences)
+            self.assertEqual([cost_view.weight(index) for index in range(0, grid.size)], weights.tolist())
+            self.assertFalse(grid.base_weights(ignore_terrain_differences)[0].flags.writeable)
+
+        # replanning around bad points
+        bad_pts = [test_world.point(x=x, y=y) for x, y in path[1:-1]]
+        replanned_path = test_world.path_between(from_point, to_point, bad_pts=bad_pts)
+        self.assertEqual(set(replanned_path[1:-1]) & set(path[1:-1]), set())
+
+    def testHierarchicalPath(self):
+        test_world = self.make_world(bottom_left_room='W2N0', top_right_room='W0N0', hierarchical_path_range=60)
+        from_point = test_world.point(snapshot_json={'room_name': 'W2N0', 'x': 10, 'y': 25})
+        to_point = test_world.point(snapshot_json={'room_name': 'W0N0', 'x': 40, 'y': 25})
+        path = test_world.path_between(from_point, to_point)
+        test_world.hierarchical_path_range = 0
+        full_path = test_world.search_path(from_point, to_point)
+
+        # every step is a move the full grid allows, and the route is close to the full search
+        grid = test_world.search_grid()
+        for from_node, to_node in zip(path, path[1:]):
+            self.assertIn(grid.index(*to_node), list(grid.neighbours(grid.index(*from_node))))
+        self.assertEqual((path[0], path[-1]), (from_point.node, to_point.node))
+        self.assertLessEqual(path_weight(test_world, path), path_weight(test_world, full_path) * 1.1)
+        self.assertEqual(len(test_world.room_graphs), 3)
+
+        # it's opt in, by default long routes get the full search
+        default_world = self.make_world(bottom_left_room='W2N0', top_right_room='W0N0')
+        self.assertEqual(default_world.path_between(from_point, to_point), full_path)
+
+    def testHierarchicalBlockedPortal(self):
+        test_world = self.make_world(hierarchical_path_range=60, path_cache_size=0)
+        from_point = test_world.point(snapshot_json={'room_name': 'W1N0', 'x': 10, 'y': 25})
+        to_point = test_world.point(snapshot_json={'room_name': 'W0N1', 'x': 40, 'y': 25})
+        path = test_world.path_between(from_point, to_point)
+        crossing = [(node, next_node) for node, next_node in zip(path, path[1:])
+                    if (node[0] // 50, node[1] // 50) != (next_node[0] // 50, next_node[1] // 50)][0]
+
+        # the room route goes through other portals when bad points or static objects sit on the one it took
+        bad_pts = [test_world.point(x=x, y=y) for x, y in crossing]
+        self.assertFalse(set(crossing) & set(test_world.hierarchical_path(from_point, to_point, bad_pts=bad_pts)))
+        self.assertFalse(set(crossing) & set(test_world.path_between(from_point, to_point, bad_pts=bad_pts)))
+        spawn = types.SimpleNamespace(static_object=True, passable=False, starting_location=bad_pts[1])
+        test_world.add_game_objects({'spawn': spawn})
+        self.assertNotIn(crossing[1], test_world.hierarchical_path(from_point, to_point))
+        self.assertIn(crossing[1], test_world.hierarchical_path(from_point, to_point, include_static_objects=False))
+
+    def testGoalSet(self):
+        test_world = self.make_world()
+        from_point = test_world.point(snapshot_json={'room_name': 'W1N0', 'x': 25, 'y': 25})
+        to_point = test_world.point(snapshot_json={'room_name': 'W0N1', 'x': 25, 'y': 25})
+        exact_path = test_world.path_between(from_point, to_point)
+        exact_expanded = test_world.path_search_stats['expanded']
+
+        # the search stops on the first tile in range, no dearer than cutting the exact path short
+        path = test_world.path_between(from_point, to_point, radius=3)
+        self.assertEqual(max([abs(path[-1][0] - to_point.x), abs(path[-1][1] - to_point.y)]), 3)
+        cut_path = [node for node in exact_path if max([abs(node[0] - to_point.x), abs(node[1] - to_point.y)]) > 3]
+        cut_path.append(exact_path[len(cut_path)])
+        self.assertLessEqual(path_weight(test_world, path), path_weight(test_world, cut_path))
+        self.assertLess(test_world.path_search_stats['expanded'] - exact_expanded, exact_expanded)
+
+        # and the body walk ends in range
+        body_path, body_ticks = test_world.path_for_body_at_time(from_point, to_point, 1, ['move', 'carry'], radius=1)
+        self.assertEqual(body_path[-1].range(to_point), 1)
+        self.assertEqual(len(body_path), len(body_ticks))
+
+    def testGoalSetBlockedTiles(self):
+        test_world = self.make_world(path_cache_size=0)
+        from_point = test_world.point(snapshot_json={'room_name': 'W1N0', 'x': 10, 'y': 20})
+        targets = [test_world.point(x=x, y=y) for x in range(55, 95, 3) for y in range(55, 95, 3)]
+        targets = [pt for pt in targets if pt.terrain != 255 and
+                   any([test_world.terrain.cost(pt.x + d_x, pt.y + d_y) == 255 for d_x in [-1, 0, 1] for d_y in [-1, 0, 1]])]
+
+        # searches in range of the target never end on a wall, or on a bad point next to it
+        for path_search_mode, kernel_backend in [('astar', 'python'), ('jump_point', 'python'), ('bidirectional', 'python')] + \
+                ([('astar', 'numba')] if kernels.numba is not None else []):
+            test_world.path_search_mode = path_search_mode
+            test_world.kernel_backend = kernel_backend
+            for to_point in targets[:12]:
+                end_point = test_world.point(*test_world.path_between(from_point, to_point, radius=1)[-1])
+                self.assertNotEqual(end_point.terrain, 255)
+                bad_path = test_world.path_between(from_point, to_point, bad_pts=[end_point], radius=1)
+                self.assertNotEqual(bad_path[-1], end_point.node)
+                self.assertNotEqual(test_world.point(*bad_path[-1]).terrain, 255)
+                self.assertLessEqual(test_world.point(*bad_path[-1]).range(to_point), 1)
+            nearest_target, path = test_world.nearest(from_point, targets, radius=1)
+            self.assertNotEqual(test_world.point(*path[-1]).terrain, 255)
+
+        # the target itself is still a goal when it's blocked
+        blocked_target = targets[0]
+        path = test_world.path_between(from_point, blocked_target, bad_pts=[blocked_target])
+        self.assertEqual(path[-1], blocked_target.node)
+
+    def testJumpPointSearch(self):
+
+        # an open plain room next to the random ones
+        FakeTerrainHandler.changed_rooms['W1N0'] = '0' * 2500
+        astar_world = self.make_world(path_cache_size=0)
+        jump_point_world = self.make_world(path_cache_size=0, path_search_mode='jump_point')
+        point = lambda test_world, room_name, x, y: test_world.point(snapshot_json={'room_name': room_name, 'x': x, 'y': y})
+        for from_room_name, from_x, from_y, to_room_name, to_x, to_y, radius in [
+                ('W1N0', 5, 40, 'W1N0', 44, 12, 0), ('W1N0', 30, 3, 'W1N0', 12, 31, 2),
+                ('W1N0', 25, 25, 'W0N1', 25, 25, 0), ('W1N0', 25, 25, 'W1N0', 30, 10, 1)]:
+            paths = []
+            for test_world in [astar_world, jump_point_world]:
+                paths.append(test_world.path_between(point(test_world, from_room_name, from_x, from_y),
+                                                     point(test_world, to_room_name, to_x, to_y), radius=radius))
+
+            # same weight, every move to a neighbour
+            astar_path, jump_point_path = paths
+            self.assertEqual(jump_point_path[0], astar_path[0])
+            self.assertAlmostEqual(path_weight(astar_world, jump_point_path), path_weight(astar_world, astar_path))
+            self.assertEqual(len(jump_point_path), len(set(jump_point_path)))
+            for (x, y), (next_x, next_y) in zip(jump_point_path, jump_point_path[1:]):
+                self.assertEqual(max(abs(next_x - x), abs(next_y - y)), 1)
+
+        # the plain takes far fewer expansions
+        self.assertLess(jump_point_world.path_search_stats['expanded'] * 2, astar_world.path_search_stats['expanded'])
+
+    def testBidirectionalSearch(self):
+        astar_world = self.make_world(path_cache_size=0)
+        auto_world = self.make_world(path_cache_size=0, path_search_mode='auto', bidirectional_path_range=30)
+        point = lambda test_world, room_name, x, y: test_world.point(snapshot_json={'room_name': room_name, 'x': x, 'y': y})
+        for to_room_name, to_x, to_y, radius in [('W0N1', 25, 25, 0), ('W0N0', 40, 10, 2), ('W1N1', 30, 30, 1)]:
+            to_point = point(astar_world, to_room_name, to_x, to_y)
+            astar_path, auto_path = [test_world.path_between(point(test_world, 'W1N0', 10, 20),
+                                                             point(test_world, to_room_name, to_x, to_y), radius=radius)
+                                     for test_world in [astar_world, auto_world]]
+            self.assertEqual(auto_path[0], astar_path[0])
+            self.assertLessEqual(max([abs(auto_path[-1][0] - to_point.x), abs(auto_path[-1][1] - to_point.y)]), radius)
+            self.assertAlmostEqual(path_weight(astar_world, auto_path), path_weight(astar_world, astar_path))
+            for (x, y), (next_x, next_y) in zip(auto_path, auto_path[1:]):
+                self.assertEqual(max(abs(next_x - x), abs(next_y - y)), 1)
+
+        # several targets meet at the same nearest one
+        origin = point(astar_world, 'W1N0', 25, 25)
+        targets = [point(astar_world, 'W0N1', 10, 10), point(astar_world, 'W0N0', 40, 40), point(astar_world, 'W1N1', 20, 5)]
+        grid = astar_world.search_grid(origin, *targets)
+        cost_view = astar_world.cost_view(grid)
+        target_indexes = [grid.index(pt.x, pt.y) for pt in targets]
+        astar_path, astar_number = pathfinding.astar_search(grid, grid.index(origin.x, origin.y), target_indexes, cost_view)
+        path, number = pathfinding.bidirectional_search(grid, grid.index(origin.x, origin.y), target_indexes, cost_view)
+        self.assertEqual(number, astar_number)
+        self.assertEqual(path[-1], target_indexes[number])
+        self.assertEqual(sum([cost_view.weight(index) for index in path[:-1]]),
+                         sum([cost_view.weight(index) for index in astar_path[:-1]]))
+
+    def testNearest(self):
+        test_world = self.make_world()
+        origin = test_world.point(snapshot_json={'room_name': 'W1N0', 'x': 25, 'y': 25})
+        targets = [test_world.point(snapshot_json={'room_name': 'W0N1', 'x': 25, 'y': 25}),
+                   test_world.point(snapshot_json={'room_name': 'W1N1', 'x': 30, 'y': 30}),
+                   types.SimpleNamespace(starting_location=test_world.point(snapshot_json={'room_name': 'W0N0', 'x': 20, 'y': 25}))]
+
+        # one search picks the target with the cheapest path in range
+        test_world.path_search_stats = {}
+        nearest_target, path = test_world.nearest(origin, targets, radius=1)
+        self.assertEqual(test_world.path_search_stats['searches'], 1)
+        path_weights = []
+        for target in targets:
+            target_point = target if isinstance(target, world.Point) else target.starting_location
+            path_weights.append(path_weight(test_world, test_world.path_between(origin, target_point, radius=1)))
+        self.assertIs(nearest_target, targets[path_weights.index(min(path_weights))])
+        self.assertAlmostEqual(path_weight(test_world, path), min(path_weights))
+        self.assertEqual(test_world.nearest(origin, []), (None, None))
+
+
+class TestLandmarks(FakeServerTestCase):
+
+    def testLandmarkSearch(self):
+        test_world = self.make_world(landmark_count=4, path_cache_size=0)
+        from_point = test_world.point(snapshot_json={'room_name': 'W1N0', 'x': 10, 'y': 10})
+        to_point = test_world.point(snapshot_json={'room_name': 'W0N1', 'x': 40, 'y': 40})
+        path = test_world.path_between(from_point, to_point)
+        chebyshev_expanded = test_world.path_search_stats['expanded']
+
+        # same cost with fewer expansions
+        test_world.build_landmarks()
+        landmark_path = test_world.path_between(from_point, to_point)
+        self.assertAlmostEqual(path_weight(test_world, landmark_path), path_weight(test_world, path))
+        self.assertLess(test_world.path_search_stats['expanded'] - chebyshev_expanded, chebyshev_expanded)
+
+        # saved next to the terrain store, mapped by the first search that can use them
+        reloaded_world = self.make_world(landmark_count=4)
+        self.assertIsNone(reloaded_world.landmarks)
+        reloaded_world.path_between(from_point, to_point)
+        self.assertEqual(reloaded_world.landmarks.nodes.tolist(), test_world.landmarks.nodes.tolist())
+        self.assertIsInstance(reloaded_world.landmarks.forward, np.memmap)
+        self.assertEqual(reloaded_world.landmarks.forward.dtype, np.uint16)
+
+        # and only used on the terrain they were built for
+        FakeTerrainHandler.changed_rooms['W1N1'] = '0' * 2500
+        reloaded_world.terrain.refresh_terrain()
+        self.assertIsNone(reloaded_world.search_landmarks())
+        self.assertIsNone(reloaded_world.load_landmarks())
+        self.assertIsNone(self.make_world(landmark_count=4).search_landmarks())
+
+    def testSaturatedDistances(self):
+        test_world = self.make_world(landmark_count=4)
+        to_point = test_world.point(snapshot_json={'room_name': 'W0N1', 'x': 40, 'y': 40})
+        grid = test_world.search_grid()
+        cost_view = test_world.cost_view(grid)
+        target = grid.index(to_point.x, to_point.y)
+        distances = scipy.sparse.csgraph.dijkstra(grid.csr_adjacency(np.asarray(cost_view.base)).T, indices=target)
+
+        # distances cut off well short of the world's still never overestimate
+        with mock.patch.object(pathfinding.Landmarks, 'SATURATED', 1000):
+            landmarks = test_world.build_landmarks(save=False)
+            self.assertTrue((landmarks.forward == 1000).any() and (landmarks.backward == 1000).any())
+            for source in range(0, grid.size, 97):
+                heuristic = landmarks.heuristic(grid, to_point.x, to_point.y, source, cost_view.min_weight)
+                self.assertTrue((heuristic <= distances + 1e-6).all())
+
+
+class TestStaticObstacles(FakeServerTestCase):
+
+    def testStaticLayerVersion(self):
+        test_world = self.make_world()
+        from_point = test_world.point(snapshot_json={'room_name': 'W1N0', 'x': 25, 'y': 25})
+        to_point = test_world.point(snapshot_json={'room_name': 'W1N0', 'x': 35, 'y': 25})
+        path = test_world.path_between(from_point, to_point)
+        blocking_point = test_world.point(x=path[1][0], y=path[1][1])
+
+        # an impassable static object changes the layer once
+        spawn = types.SimpleNamespace(static_object=True, passable=False, starting_location=blocking_point)
+        creep = types.SimpleNamespace(static_object=False, passable=False, starting_location=from_point)
+        test_world.add_game_objects({'spawn': spawn, 'creep': creep})
+        self.assertEqual(test_world.static_obstacle_version, 1)
+        test_world.add_game_objects({'spawn': spawn})
+        self.assertEqual(test_world.static_obstacle_version, 1)
+        self.assertNotIn(blocking_point.node, test_world.path_between(from_point, to_point))
+        self.assertIn(blocking_point.node, test_world.path_between(from_point, to_point, include_static_objects=False))
+
+        # and a new turn clears it
+        test_world.init_new_turn()
+        self.assertEqual(test_world.static_obstacle_version, 2)
+        self.assertEqual(test_world.path_between(from_point, to_point), path)
+
+
+class TestPathCache(FakeServerTestCase):
+
+    def testHitsAndInvalidation(self):
+        test_world = self.make_world(path_cache_size=2)
+        from_point = test_world.point(snapshot_json={'room_name': 'W1N0', 'x': 25, 'y': 25})
+        to_point = test_world.point(snapshot_json={'room_name': 'W1N0', 'x': 35, 'y': 25})
+        path = test_world.path_between(from_point, to_point)
+        self.assertEqual(test_world.path_between(from_point, to_point), path)
+        self.assertEqual((test_world.path_cache_hits, test_world.path_cache_misses), (1, 1))
+
+        # a static obstacle only invalidates searches that include static objects
+        spawn = types.SimpleNamespace(static_object=True, passable=False, starting_location=test_world.point(x=path[1][0], y=path[1][1]))
+        test_world.add_game_objects({'spawn': spawn})
+        test_world.path_between(from_point, to_point, include_static_objects=False)
+        self.assertNotEqual(test_world.path_between(from_point, to_point), path)
+        self.assertEqual(test_world.path_between(from_point, to_point, include_static_objects=False), path)
+        self.assertEqual((test_world.path_cache_hits, test_world.path_cache_misses), (2, 3))
+
+        # terrain refreshes move the terrain version on
+        FakeTerrainHandler.changed_rooms['W1N0'] = '0' * 2500
+        test_world.terrain.refresh_terrain()
+        test_world.path_between(from_point, to_point)
+        self.assertEqual(test_world.path_cache_misses, 4)
+        self.assertEqual(len(test_world.path_cache), 2)
+
+
+class TestSpaceTime(FakeServerTestCase):
+
+    def testWaitsAndDetours(self):
+        test_world = self.make_world()
+        from_point = test_world.point(snapshot_json={'room_name': 'W1N0', 'x': 20, 'y': 25})
+        to_point = test_world.point(snapshot_json={'room_name': 'W1N0', 'x': 30, 'y': 25})
+        body = ['move', 'carry', 'work', 'move']
+        free_path, free_ticks = test_world.space_time_path(from_point, to_point, 100, body)
+        self.assertEqual(len(free_path), len(free_ticks))
+
+        # a creep parked across the straight line for the first few ticks
+        blocker_node = free_path[5].node
+        blocker = types.SimpleNamespace(static_object=False, passable=False, universal_id='blocker',
+                                        alive=lambda tick: tick <= 110,
+                                        location=lambda tick: test_world.point(x=blocker_node[0], y=blocker_node[1]))
+        test_world.add_game_objects({'blocker': blocker})
+        path, path_ticks = test_world.path_for_body_at_time(from_point, to_point, 100, body)
+        self.assertEqual(path[-1].node, to_point.node)
+        for point, tick in zip(path, path_ticks):
+            self.assertFalse(point.node == blocker_node and tick <= 110)
+        self.assertGreaterEqual(path_ticks[-1], free_ticks[-1])
+        self.assertLessEqual(path_ticks[-1], free_ticks[-1] + 2)
+
+        # claims made by an earlier plan are avoided too
+        reservations = pathfinding.ReservationTable()
+        for point, tick in zip(free_path, free_ticks):
+            reservations.claim(point.node, tick)
+        path, path_ticks = test_world.space_time_path(from_point, to_point, 100, body, reservations=reservations)
+        self.assertFalse(set(zip([pt.node for pt in path[1:]], path_ticks[1:])) &
+                         set(zip([pt.node for pt in free_path], free_ticks)))
+
+    def testPlanPaths(self):
+        test_world = self.make_world()
+        body = ['move', 'carry']
+        point = lambda x, y: test_world.point(snapshot_json={'room_name': 'W1N0', 'x': x, 'y': y})
+
+        # three creeps crossing through the same few tiles at the same time
+        requests = [(types.SimpleNamespace(universal_id='first'), body, point(20, 25), point(30, 25), 100, 0),
+                    (types.SimpleNamespace(universal_id='second'), body, point(30, 25), point(20, 25), 100, 0),
+                    (types.SimpleNamespace(universal_id='third'), body, point(25, 20), point(25, 30), 100, 0)]
+        plans = test_world.plan_paths(requests)
+        self.assertEqual(len(plans), 3)
+        occupied = {}
+        for (path_finding_object, _, _, to_point, _, _), (path, path_ticks) in zip(requests, plans):
+            self.assertEqual(path[-1].node, to_point.node)
+            for node, tick, next_tick in zip([pt.node for pt in path], path_ticks, path_ticks[1:] + [path_ticks[-1] + 1]):
+                for hold_tick in range(tick, next_tick):
+                    self.assertNotIn((node, hold_tick), occupied)
+                    occupied[(node, hold_tick)] = path_finding_object.universal_id
+
+        # the first request gets the unobstructed plan
+        self.assertEqual(plans[0][1], test_world.space_time_path(point(20, 25), point(30, 25), 100, body)[1])
+
+        # requests without an object plan with the body given, and need one or the other
+        plans = test_world.plan_paths([(None, body, point(20, 25), point(30, 25), 100, 0)])
+        self.assertEqual(plans[0][0][-1].node, point(30, 25).node)
+        with self.assertRaises(ValueError):
+            test_world.plan_paths([(None, None, point(20, 25), point(30, 25), 100, 0)])
+
+    def testFastestPath(self):
+
+        # a swamp band across the straight line, quicker to wade through than to walk around for a light creep
+        terrain_characters = ['0'] * 2500
+        for y in range(14, 36):
+            for x in range(23, 28):
+                terrain_characters[y * 50 + x] = '2'
+        FakeTerrainHandler.changed_rooms['W1N0'] = ''.join(terrain_characters)
+        test_world = self.make_world()
+        from_point = test_world.point(snapshot_json={'room_name': 'W1N0', 'x': 20, 'y': 25})
+        to_point = test_world.point(snapshot_json={'room_name': 'W1N0', 'x': 30, 'y': 25})
+        body = ['move', 'move', 'carry']
+        path, path_ticks = test_world.fastest_path(from_point, to_point, 100, body)
+        self.assertEqual(path[-1].node, to_point.node)
+        self.assertTrue(any([pt.terrain == 10 for pt in path]))
+
+        # the ticks are the ones walking it would take, and earlier than walking the lightest path
+        tick = 100
+        for pt, path_tick in zip(path[1:], path_ticks[1:]):
+            self.assertEqual(path_tick, tick + 1)
+            tick += pathfinding.move_ticks(pt.terrain, 1, 4)
+        replanned_ticks = test_world.replanning_path_for_body_at_time(from_point, to_point, 100, body)[1]
+        self.assertLess(path_ticks[-1], replanned_ticks[-1])
+        self.assertEqual(test_world.path_for_body_at_time(from_point, to_point, 100, body)[1], path_ticks)
+
+
+class TestFlowFields(FakeServerTestCase):
+
+    def testFollowField(self):
+        test_world = self.make_world()
+        target_point = test_world.point(snapshot_json={'room_name': 'W0N1', 'x': 30, 'y': 20})
+        from_point = test_world.point(snapshot_json={'room_name': 'W1N0', 'x': 25, 'y': 25})
+        flow_field = test_world.flow_field(target_point)
+        self.assertIs(test_world.build_flow_fields([target_point])[0], flow_field)
+
+        # following the next directions reaches the target at the cost of the best path
+        path = [from_point.node]
+        point = from_point
+        while point.node != target_point.node:
+            delta = screeps_utilities.delta_from_direction(test_world.next_direction(point, target_point))
+            point = test_world.point(x=point.x + delta['x'], y=point.y + delta['y'])
+            path.append(point.node)
+        self.assertAlmostEqual(path_weight(test_world, path), flow_field.distance(from_point.x, from_point.y))
+        self.assertAlmostEqual(path_weight(test_world, path),
+                               path_weight(test_world, test_world.path_between(from_point, target_point)))
+        self.assertEqual(test_world.next_direction(target_point, target_point), 0)
+
+    def testHotTargets(self):
+        test_world = self.make_world()
+        spawn_point = test_world.point(snapshot_json={'room_name': 'W1N0', 'x': 25, 'y': 25})
+        player = types.SimpleNamespace(kingdom_flags=[])
+        source = game_objects.Source({'id': 'source', 'code_type': 'source',
+                                      'pos': {'room_name': 'W0N1', 'x': 30, 'y': 20}}, 0, test_world, player)
+        spawn = types.SimpleNamespace(universal_id='spawn', specific_type='spawn', starting_location=spawn_point)
+        test_world.game_objects.update({'source': source, 'spawn': spawn})
+
+        # a source without a kingdom flag to harvest towards isn't a target
+        self.assertEqual([pt.node for pt in test_world.hot_targets()], [spawn_point.node])
+        self.assertEqual(len(test_world.build_flow_fields()), 1)
+
+        # with one it's harvested from the tile next to it towards the flag
+        player.kingdom_flags.append(types.SimpleNamespace(starting_location=spawn_point))
+        hot_targets = test_world.hot_targets()
+        self.assertEqual(len(hot_targets), 2)
+        self.assertEqual(source.starting_location.range(hot_targets[0]), 1)
+
+
+class TestExitTables(FakeServerTestCase):
+
+    def testEstimateRouteCost(self):
+        test_world = self.make_world(bottom_left_room='W2N0', top_right_room='W0N0')
+        spawn_point = test_world.point(snapshot_json={'room_name': 'W2N0', 'x': 10, 'y': 25})
+        source_point = test_world.point(snapshot_json={'room_name': 'W0N0', 'x': 40, 'y': 25})
+        spawn = types.SimpleNamespace(universal_id='spawn', specific_type='spawn', static_object=True, passable=False,
+                                      starting_location=spawn_point)
+        source = types.SimpleNamespace(universal_id='source', specific_type='source', static_object=True, passable=False,
+                                       starting_location=source_point)
+        test_world.add_game_objects({'spawn': spawn, 'source': source})
+
+        # the table route goes through portals, so it's never cheaper than the true distance and stays close to it
+        estimate = test_world.estimate_route_cost(spawn, source)
+        distance = test_world.distances_from(spawn_point, [source_point], include_static_objects=False)[0]
+        self.assertGreaterEqual(estimate, distance - 1e-6)
+        self.assertLessEqual(estimate, distance * 1.1)
+
+        # the saved tables are picked up again, until the terrain under them changes
+        self.assertTrue(os.path.exists(test_world.exit_tables_path))
+        reloaded_world = self.make_world(bottom_left_room='W2N0', top_right_room='W0N0')
+        self.assertIsNotNone(reloaded_world.load_exit_tables())
+        self.assertEqual(reloaded_world.exit_tables.route_cost(reloaded_world.exit_tables.object_numbers['spawn'],
+                                                               reloaded_world.exit_tables.object_numbers['source']),
+                         estimate * pathfinding.PATH_WEIGHT_SCALE)
+        FakeTerrainHandler.changed_rooms['W1N0'] = '0' * 2500
+        reloaded_world.terrain.refresh_terrain()
+        self.assertIsNone(reloaded_world.load_exit_tables())
+
+        # tables already in use are swapped for ones built on the refreshed terrain
+        FakeTerrainHandler.changed_rooms['W1N0'] = '2' * 2500
+        test_world.terrain.refresh_terrain()
+        refreshed_estimate = test_world.estimate_route_cost(spawn, source)
+        refreshed_distance = test_world.distances_from(spawn_point, [source_point], include_static_objects=False)[0]
+        self.assertEqual(test_world.exit_tables_terrain_version, test_world.terrain.version)
+        self.assertGreater(refreshed_estimate, estimate)
+        self.assertGreaterEqual(refreshed_estimate, refreshed_distance - 1e-6)
+        self.assertLessEqual(refreshed_estimate, refreshed_distance * 1.1)
+
+        # objects the tables don't cover are turned away without rebuilding them
+        creep = types.SimpleNamespace(universal_id='creep', specific_type='creep', starting_location=spawn_point)
+        lost_source = types.SimpleNamespace(universal_id='lost', specific_type='source', starting_location=source_point)
+        with mock.patch.object(test_world, 'build_exit_tables', wraps=test_world.build_exit_tables) as builder:
+            with self.assertRaises(ValueError):
+                test_world.estimate_route_cost(creep, spawn)
+            self.assertEqual(builder.call_count, 0)
+
+            # table objects missing from the world are rebuilt for once before giving up
+            with self.assertRaises(ValueError):
+                test_world.estimate_route_cost(spawn, lost_source)
+            self.assertEqual(builder.call_count, 1)
+
+
+class TestKernels(FakeServerTestCase):
+
+    def backends(self):
+        return ['python'] + (['numba'] if kernels.numba is not None else [])
+
+    def testAstarKernel(self):
+        test_world = self.make_world(kernel_backend='python')
+        self.assertIs(test_world.path_search(0), pathfinding.astar_search)
+        if kernels.numba is not None:
+            self.assertIs(self.make_world(kernel_backend='numba').path_search(0), pathfinding.compiled_astar_search)
+        origin = test_world.point(snapshot_json={'room_name': 'W1N0', 'x': 10, 'y': 20})
+        targets = [test_world.point(snapshot_json={'room_name': 'W0N1', 'x': 25, 'y': 25}),
+                   test_world.point(snapshot_json={'room_name': 'W0N0', 'x': 40, 'y': 10})]
+        grid = test_world.search_grid(origin, *targets)
+        target_indexes = [grid.index(point.x, point.y) for point in targets]
+        blocked_indexes = frozenset([grid.index(origin.x + 1, origin.y + delta_y) for delta_y in [-1, 0, 1]])
+
+        # the kernel finds the same path with the same counts as astar_search, compiled or not
+        for cost_view, search_targets, radius in [(test_world.cost_view(grid), target_indexes[:1], 0),
+                                                  (pathfinding.CostView(grid, override_indexes=blocked_indexes),
+                                                   target_indexes, 1),
+                                                  (pathfinding.CostView(grid, ignore_terrain_differences=True),
+                                                   target_indexes[::-1], 2)]:
+            stats = {}
+            expected = pathfinding.astar_search(grid, grid.index(origin.x, origin.y), search_targets, cost_view,
+                                                stats=stats, radius=radius)
+            for backend in self.backends():
+                kernel_stats = {}
+                self.assertEqual(pathfinding.compiled_astar_search(grid, grid.index(origin.x, origin.y), search_targets,
+                                                                   cost_view, stats=kernel_stats, radius=radius,
+                                                                   backend=backend), expected)
+                self.assertEqual(kernel_stats, stats)
+
+        # nowhere to go
+        walled_view = pathfinding.CostView(grid)
+        walled_grid = types.SimpleNamespace(size=grid.size, width=grid.width, height=grid.height,
+                                            steps=grid.steps, move_array=grid.move_array * 0)
+        for backend in self.backends():
+            self.assertEqual(pathfinding.compiled_astar_search(walled_grid, grid.index(origin.x, origin.y),
+                                                               target_indexes, walled_view, backend=backend),
+                             (None, None))
+
+    def testStoreContents(self):
+        spawn_tasks = {5: {'creep': [{'type': 'transfer', 'assigned_to': 'creep', 'tick': 5,
+                                      'details': {'target': 'spawn', 'resource_type': 'energy', 'amount': 50}}]},
+                       30: {'spawn': [{'type': 'transfer', 'assigned_to': 'spawn', 'tick': 30,
+                                       'details': {'target': 'creep', 'resource_type': 'energy', 'amount': 20}}]},
+                       50: {'spawn': [{'type': 'spawnCreep', 'assigned_to': 'spawn', 'tick': 50,
+                                       'details': {'body': ['work', 'carry', 'move']}}]}}
+        spawn_creep = lambda tick, body: {'type': 'spawnCreep', 'assigned_to': 'spawn', 'tick': tick,
+                                          'details': {'body': body}}
+        for backend in self.backends():
+            spawn = types.SimpleNamespace(
+                store=game_objects.Store({'capacity': {'energy': 200}, 'used_capacity': {'energy': 150}}, 0, None,
+                                         regen_per_tick=1),
+                player=types.SimpleNamespace(tasks=spawn_tasks), snapshot_tick=0, universal_id='spawn',
+                specific_type='spawn', body=None, world=types.SimpleNamespace(kernel_backend=backend))
+
+            # regeneration stops at capacity, transfers don't
+            self.assertEqual(game_objects.GameObject.store_contents(spawn, 40), {'energy': 195})
+            self.assertEqual(game_objects.GameObject.store_contents(spawn, 6), {'energy': 206})
+
+            # a new task is good as long as the store never goes negative
+            self.assertTrue(game_objects.GameObject.store_contents(spawn, 40, spawn_creep(2, ['carry', 'move'])))
+            self.assertFalse(game_objects.GameObject.store_contents(spawn, 40, spawn_creep(35, ['work', 'carry', 'move'])))
+            self.assertTrue(game_objects.GameObject.store_contents(spawn, 30, spawn_creep(35, ['work', 'carry', 'move'])))
+
+            # tasks loaded from json are keyed by string ticks
+            spawn.player = types.SimpleNamespace(tasks=dict([(str(tick), tasks) for tick, tasks in spawn_tasks.items()]))
+            self.assertEqual(game_objects.GameObject.store_contents(spawn, 40), {'energy': 195})
+            self.assertFalse(game_objects.GameObject.store_contents(spawn, 40, spawn_creep(35, ['work', 'carry', 'move'])))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,15 +1,71 @@
-import networkx as nx
 import configparser
 from screeps_utilities import js_row_col_to_room, create_api_connection_from_config, js_room_row_col
 import os
 import numpy as np
 import pickle
+import struct
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from multiprocessing import shared_memory, resource_tracker
 import constants
+from scipy.sparse import save_npz
+from kernels import resolve_backend
+from pathfinding import SearchGrid, CostView, RoomGraph, ExitTables, FlowField, Landmarks, ReservationTable, TickField, \
+    PATH_SEARCHES, COMPILED_PATH_SEARCHES, portal_search, space_time_path, move_ticks, distance_matrix, scaled_distance_matrix, \
+    PATH_WEIGHT_SCALE
 
 # logging
 import logging
 logger = logging.getLogger(__name__)
 
+# terrain cost lookup indexed by encoded terrain character (0 plain, 1 wall, 2 swamp, 3 wall on swamp)
+TERRAIN_COST_LOOKUP = np.array([2, 255, 10, 255], dtype=np.uint8)
+
+# room tiles that sit on the edge of the room (exit tiles)
+ROOM_EDGE_MASK = np.zeros((50, 50), dtype=bool)
+ROOM_EDGE_MASK[[0, -1], :] = True
+ROOM_EDGE_MASK[:, [0, -1]] = True
+
+# objects with exit distance table entries
+EXIT_TABLE_OBJECT_TYPES = ['source', 'controller', 'spawn']
+
+# number of search windows kept around for path finding
+SEARCH_GRID_CACHE_SIZE = 8
+
+# binary terrain store layout (fixed size header, uint8 cost layer, then the packed exit tile bitmask)
+TERRAIN_STORE_MAGIC = b'SCRPTRRN'
+TERRAIN_STORE_VERSION = 2
+TERRAIN_STORE_HEADER = struct.Struct('<8sIiiII')
+TERRAIN_STORE_HEADER_SIZE = 64
+
+
+def attach_shared_memory(name):
+
+    # attached blocks belong to the publisher, so workers must not let the resource tracker unlink them on exit
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args, **kwargs: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+def terrain_string_hash(terrain_string):
+    return hashlib.sha1(terrain_string.encode('ascii')).hexdigest()
+
+
+def terrain_block_from_string(terrain_string):
+
+    # terrain characters as integers in screeps order (first character is the top left of the room)
+    terrain_codes = np.frombuffer(terrain_string.encode('ascii'), dtype=np.uint8) - ord('0')
+
+    # reshape to the room and flip so row 0 is the bottom of the room like the world matrix
+    return TERRAIN_COST_LOOKUP[np.flipud(terrain_codes.reshape(50, 50))]
+
 
 class Point:
 
@@ -65,8 +121,8 @@ class Point:
     def js_y(self):
         return self.js_x_y['y']
 
-    def path_to(self, to_point, bad_pts=[], include_static_objects=True, ignore_terrain_differences=False):
-        return self.world.path_between(from_point=self, to_point=to_point, bad_pts=bad_pts, include_static_objects=include_static_objects, ignore_terrain_differences=ignore_terrain_differences)
+    def path_to(self, to_point, bad_pts=[], include_static_objects=True, ignore_terrain_differences=False, radius=0):
+        return self.world.path_between(from_point=self, to_point=to_point, bad_pts=bad_pts, include_static_objects=include_static_objects, ignore_terrain_differences=ignore_terrain_differences, radius=radius)
 
     @property
     def node(self):
@@ -88,7 +144,11 @@ class Point:
 
     @property
     def terrain(self):
-        return self.world.terrain.terrain_matrix[self.y, self.x]
+        return self.world.terrain.cost(self.x, self.y)
+
+    @property
+    def exit_tile(self):
+        return self.world.terrain.is_exit(self.x, self.y)
 
     def move_direction_to_point(self, to_point):
 
@@ -201,8 +261,48 @@ class Line:
             self.points = points
 
 
+class TerrainTiles:
+
+    def __init__(self, terrain, memory_budget_mb):
+
+        # terrain the rooms are loaded through
+        self.terrain = terrain
+
+        # least recently used room cost blocks keyed by world row col
+        self.tiles = OrderedDict()
+        self.max_tiles = max(1, int(memory_budget_mb * 1024 * 1024) // (50 * 50))
+
+        # stats
+        self.loads = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def tile(self, row, col):
+
+        # already resident so just mark it as recently used
+        key = (row, col)
+        if key in self.tiles:
+            self.tiles.move_to_end(key)
+            return self.tiles[key]
+
+        # load the room on first access
+        tile = self.terrain.room_cost_block(Room(row=row, col=col, world=self.terrain.world))
+        self.tiles[key] = tile
+        self.loads += 1
+
+        # evict the least recently used rooms once over budget
+        while len(self.tiles) > self.max_tiles:
+            evicted_key, _ = self.tiles.popitem(last=False)
+            self.evictions += 1
+            logger.info(f'evicted terrain tile {evicted_key}')
+
+        return tile
+
+
 class Terrain:
-    def __init__(self, api, world, shard='shard3'):
+    def __init__(self, api, world, shard='shard3', shared_terrain=None):
 
         # world info
         self.world = world
@@ -210,104 +310,449 @@ class Terrain:
         self.top_right_room_js_row_col = self.world.top_right_room_js_row_col
         self.shard = shard
 
-        # terrain cache data
+        # connection
+        self.api = api
+
+        # terrain string cache data (only read from disk once a room has to be decoded)
+        self.terrain_string_cache = None
+        self.terrain_string_cache_dirty = False
+        self.terrain_string_pickle_path = os.path.join(self.world.data_directory, 'terrain_string_cache.pickle')
+
+        # terrain store (one memory mapped file per host and shard) and content hashes of the rooms in it
+        self.terrain_store_path = os.path.join(self.world.data_directory,
+                                               f'terrain_{self.world.host_pickle_key}_{self.shard}.terrain')
+        self.room_hashes_path = os.path.join(self.world.data_directory,
+                                             f'terrain_{self.world.host_pickle_key}_{self.shard}.rooms.pickle')
         self.terrain_matrix = None
-        self.terrain_pickle_path = 'data/terrain_cache.pickle'
-        self.terrain_cache = {}
-        if os.path.exists(self.terrain_pickle_path):
-            with open(self.terrain_pickle_path, 'rb') as handle:
-                self.terrain_cache = pickle.load(handle)
-                if self.world.host_pickle_key in self.terrain_cache:
-                    self.terrain_matrix = self.terrain_cache[self.world.host_pickle_key][self.shard]
-
-        # only update the matrix if needed
-        if self.terrain_matrix is None:
-
-            # connection
-            logger.info(f'terrain was sent api with host {api.host} and token {api.token}')
-            self.api = api
-
-            # terrain string cache data
+        self.exit_bits = None
+        self.room_hashes = {}
+
+        # bumped whenever rooms are decoded again so search windows can be rebuilt
+        self.version = 0
+        if os.path.exists(self.room_hashes_path):
+            with open(self.room_hashes_path, 'rb') as handle:
+                self.room_hashes = pickle.load(handle)
+
+        # shared memory blocks this terrain published or attached to
+        self.shared_memory_blocks = []
+        self.shared_memory_owner = False
+
+        # tiled worlds load rooms as they are touched instead of mapping the whole world
+        self.tiles = None
+        if shared_terrain is not None:
+            self.attach_shared_terrain(shared_terrain)
+        else:
+            self.load_terrain()
+
+    def load_terrain(self):
+        if self.world.terrain_backend == 'tiled':
+            self.tiles = TerrainTiles(terrain=self, memory_budget_mb=self.world.terrain_memory_budget_mb)
+        else:
+            stored_terrain = self.read_terrain_store()
+            if self.store_matches_world(stored_terrain):
+                self.open_terrain_store()
+            else:
+                # only update the matrix if needed
+                logger.info(f'building terrain store {self.terrain_store_path}')
+                self.init_terrain_map(previous_store=stored_terrain)
+
+    @property
+    def shape(self):
+        world_rows, world_cols = self.world_room_shape
+        return world_rows * 50, world_cols * 50
+
+    def cost(self, x, y):
+        if self.tiles is None:
+            return int(self.terrain_matrix[y, x])
+        else:
+            return int(self.tiles.tile(y // 50, x // 50)[y % 50, x % 50])
+
+    def room_cost_block(self, room):
+
+        # decode the room from the string cache or the server
+        terrain_string = self.room_terrain_string(room)
+        terrain_block = terrain_block_from_string(terrain_string)
+        self.room_hashes[room.js_room_name] = terrain_string_hash(terrain_string)
+
+        # newly fetched strings are saved right away since tiled worlds never do a full build
+        if self.terrain_string_cache_dirty:
+            self.save_terrain_string_cache()
+
+        return terrain_block
+
+    def load_terrain_string_cache(self):
+        if self.terrain_string_cache is None:
             self.terrain_string_cache = {}
-            self.terrain_string_pickle_path = 'data/terrain_string_cache.pickle'
             if os.path.exists(self.terrain_string_pickle_path):
                 with open(self.terrain_string_pickle_path, 'rb') as handle:
                     self.terrain_string_cache = pickle.load(handle)
 
-            # load terrain
-            self.init_terrain_map()
+    def save_terrain_string_cache(self):
+        self.load_terrain_string_cache()
+        with open(self.terrain_string_pickle_path, 'wb') as handle:
+            pickle.dump(self.terrain_string_cache, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        self.terrain_string_cache_dirty = False
 
-    def update_terrain_map_from_room(self, room):
+    def room_terrain_string(self, room):
 
         # pull terrain string from cache or room
-        terrain_string = ''
-        if self.world.host_pickle_key in self.terrain_string_cache:
-            if self.shard in self.terrain_string_cache:
-                if room.js_room_name in self.terrain_string_cache:
-                    terrain_string = self.terrain_string_cache[self.world.host_pickle_key][self.shard][room.js_room_name]
-                    logger.info(f'pulled {room.js_room_name} from cache')
+        terrain_string = self.cached_room_terrain_string(room.js_room_name)
+        if terrain_string != '':
+            logger.info(f'pulled {room.js_room_name} from cache')
 
         # retrieve it since we couldn't get it from cache
         if terrain_string == '':
-            # get terrain string from server
-            terrain_string_req_return = self.api.room_terrain(room=room.js_room_name, shard=self.shard, encoded=True)
-            terrain_string = terrain_string_req_return['terrain'][0]['terrain']
-
-            # build terrain string cache keys if necessary
-            if self.world.host_pickle_key not in self.terrain_string_cache:
-                self.terrain_string_cache[self.world.host_pickle_key] = {}
-            if self.shard not in self.terrain_string_cache[self.world.host_pickle_key]:
-                self.terrain_string_cache[self.world.host_pickle_key][self.shard] = {}
-
-            # store the terrain string in the cache
-            self.terrain_string_cache[self.world.host_pickle_key][self.shard][room.js_room_name] = terrain_string
+            terrain_string = self.fetch_room_terrain_string(room.js_room_name)
+            self.cache_room_terrain_string(room.js_room_name, terrain_string)
 
             # logging
             logger.info(f'pulled {room.js_room_name} from server')
 
-        # loop through terrain string for weights
-        for terrain_character_index in range(0, len(terrain_string)):
-            terrain_point = room.point_from_terrain_index(terrain_character_index)
-            terrain_character = terrain_string[terrain_character_index]
-            terrain_weight = 255  # wall
-            if terrain_character == '0':  # plain
-                terrain_weight = 2
-            elif terrain_character == '2':  # swamp
-                terrain_weight = 10
-            if terrain_point.edge_type is not None:
-                terrain_weight += .4
-            self.terrain_matrix[terrain_point.y, terrain_point.x] = terrain_weight
-
-    def init_terrain_map(self):
+        return terrain_string
+
+    def cached_room_terrain_string(self, room_name):
+        self.load_terrain_string_cache()
+        if self.world.host_pickle_key in self.terrain_string_cache:
+            if self.shard in self.terrain_string_cache[self.world.host_pickle_key]:
+                if room_name in self.terrain_string_cache[self.world.host_pickle_key][self.shard]:
+                    return self.terrain_string_cache[self.world.host_pickle_key][self.shard][room_name]
+        return ''
+
+    def cache_room_terrain_string(self, room_name, terrain_string):
+
+        # build terrain string cache keys if necessary
+        self.load_terrain_string_cache()
+        if self.world.host_pickle_key not in self.terrain_string_cache:
+            self.terrain_string_cache[self.world.host_pickle_key] = {}
+        if self.shard not in self.terrain_string_cache[self.world.host_pickle_key]:
+            self.terrain_string_cache[self.world.host_pickle_key][self.shard] = {}
+
+        # store the terrain string in the cache
+        self.terrain_string_cache[self.world.host_pickle_key][self.shard][room_name] = terrain_string
+        self.terrain_string_cache_dirty = True
+
+    def drop_cached_room_terrain_string(self, room_name):
+        if self.cached_room_terrain_string(room_name) != '':
+            del self.terrain_string_cache[self.world.host_pickle_key][self.shard][room_name]
+            self.terrain_string_cache_dirty = True
+
+    def fetch_room_terrain_string(self, room_name):
+        terrain_string_req_return = self.api.room_terrain(room=room_name, shard=self.shard, encoded=True)
+        return terrain_string_req_return['terrain'][0]['terrain']
+
+    def fetch_missing_room_terrain(self, rooms, progress_callback=None):
+
+        # only go to the server for rooms the cache doesn't have
+        missing_room_names = [room.js_room_name for room in rooms if self.cached_room_terrain_string(room.js_room_name) == '']
+        if len(missing_room_names) == 0:
+            return 0
+        logger.info(f'fetching {len(missing_room_names)} rooms with {self.world.terrain_fetch_workers} workers')
+
+        # workers only make the requests, results are cached and checkpointed from this thread
+        fetched_rooms = 0
+        with ThreadPoolExecutor(max_workers=self.world.terrain_fetch_workers) as executor:
+            futures = {executor.submit(self.fetch_room_terrain_string, room_name): room_name
+                       for room_name in missing_room_names}
+            for future in as_completed(futures):
+                room_name = futures[future]
+                try:
+                    self.cache_room_terrain_string(room_name, future.result())
+                except Exception as fetch_exception:
+                    # leave it missing so the room falls back to a normal fetch later
+                    logger.info(f'failed to fetch {room_name}: {fetch_exception}')
+                    continue
+                fetched_rooms += 1
+
+                # progress reporting
+                logger.info(f'fetched {fetched_rooms}/{len(missing_room_names)} rooms ({room_name})')
+                if progress_callback is not None:
+                    progress_callback(fetched_rooms, len(missing_room_names))
+
+                # checkpoint partial results so an interrupted fetch doesn't start over
+                if fetched_rooms % self.world.terrain_checkpoint_rooms == 0:
+                    self.save_terrain_string_cache()
+
+        # final checkpoint
+        self.save_terrain_string_cache()
+        return fetched_rooms
+
+    def update_terrain_map_from_room(self, room):
+
+        # decode the whole room at once and write it into the world matrix
+        terrain_string = self.room_terrain_string(room)
+        y = room.row * 50
+        x = room.col * 50
+        self.terrain_matrix[y:y + 50, x:x + 50] = terrain_block_from_string(terrain_string)
+        self.room_hashes[room.js_room_name] = terrain_string_hash(terrain_string)
+
+    def copy_room_from_store(self, room, stored_terrain):
+
+        # nothing to copy from
+        if stored_terrain is None:
+            return False
+
+        # find the room in the stored world
+        stored_row = room.row + self.bottom_left_room_js_row_col['row'] - stored_terrain['origin_row']
+        stored_col = room.col + self.bottom_left_room_js_row_col['col'] - stored_terrain['origin_col']
+        if not (0 <= stored_row < stored_terrain['world_rows'] and 0 <= stored_col < stored_terrain['world_cols']):
+            return False
+
+        # copy the decoded block over as is
+        self.terrain_matrix[room.row * 50:(room.row + 1) * 50, room.col * 50:(room.col + 1) * 50] = \
+            stored_terrain['terrain_matrix'][stored_row * 50:(stored_row + 1) * 50, stored_col * 50:(stored_col + 1) * 50]
+        return True
+
+    @property
+    def world_rooms(self):
+        world_rows, world_cols = self.world_room_shape
+        return [Room(row=world_row, col=world_col, world=self.world)
+                for world_row in range(0, world_rows) for world_col in range(0, world_cols)]
+
+    def init_terrain_map(self, previous_store=None):
 
         # define rows
-        world_rows = abs(self.bottom_left_room_js_row_col['row'] - self.top_right_room_js_row_col['row']) + 1
-        world_cols = abs(self.bottom_left_room_js_row_col['col'] - self.top_right_room_js_row_col['col']) + 1
+        world_rows, world_cols = self.world_room_shape
 
         # init numpy array
         logger.info(f'world has rows {world_rows} and cols {world_cols}')
-        self.terrain_matrix = np.zeros((world_rows * 50, world_cols * 50))
+        self.terrain_matrix = np.zeros((world_rows * 50, world_cols * 50), dtype=np.uint8)
+        self.exit_bits = np.packbits(np.tile(ROOM_EDGE_MASK, (world_rows, world_cols)), axis=1)
+
+        # rooms already decoded into the previous store are copied, the rest are decoded
+        world_rooms = self.world_rooms
+        rooms_to_decode = [world_room for world_room in world_rooms
+                           if not self.copy_room_from_store(world_room, previous_store)]
+        logger.info(f'reused {len(world_rooms) - len(rooms_to_decode)} stored rooms, decoding {len(rooms_to_decode)}')
+
+        # forget hashes for rooms that are no longer in the world
+        world_room_names = set([world_room.js_room_name for world_room in world_rooms])
+        self.room_hashes = {room_name: room_hash for room_name, room_hash in self.room_hashes.items()
+                            if room_name in world_room_names}
 
-        # loop through rows
-        for world_row in range(0, world_rows):
-            for world_col in range(0, world_cols):
-                world_room = Room(row=world_row, col=world_col, world=self.world)
-                self.update_terrain_map_from_room(world_room)
+        # pull every missing room from the server at once
+        self.fetch_missing_room_terrain(rooms_to_decode)
+
+        # loop through rooms
+        for world_room in rooms_to_decode:
+            self.update_terrain_map_from_room(world_room)
 
         # save cache
-        with open(self.terrain_string_pickle_path, 'wb') as handle:
-            pickle.dump(self.terrain_string_cache, handle, protocol=pickle.HIGHEST_PROTOCOL)
-        with open(self.terrain_pickle_path, 'wb') as handle:
-            if self.world.host_pickle_key not in self.terrain_cache:
-                self.terrain_cache[self.world.host_pickle_key] = {}
-            self.terrain_cache[self.world.host_pickle_key][self.shard] = self.terrain_matrix
-            pickle.dump(self.terrain_cache, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        if self.terrain_string_cache_dirty:
+            self.save_terrain_string_cache()
+        self.write_terrain_store()
+
+        # swap the built layers for the shared read only mapping
+        self.open_terrain_store()
+
+    def refresh_terrain(self, rooms=None):
+
+        # pull fresh copies of the rooms from the server
+        if rooms is None:
+            rooms = self.world_rooms
+        for room in rooms:
+            self.drop_cached_room_terrain_string(room.js_room_name)
+        self.fetch_missing_room_terrain(rooms)
+
+        # only rooms whose content changed get decoded again (tiles that were never loaded will load fresh anyway)
+        changed_rooms = [room for room in rooms if self.room_hashes.get(room.js_room_name) !=
+                         terrain_string_hash(self.room_terrain_string(room)) and
+                         (self.tiles is None or room.js_room_name in self.room_hashes)]
+        logger.info(f'{len(changed_rooms)} of {len(rooms)} refreshed rooms changed')
+        if len(changed_rooms) == 0:
+            return changed_rooms
+        self.version += 1
+
+        if self.tiles is None:
+
+            # decode into a private copy and swap the store so other readers never see a half written world
+            self.terrain_matrix = np.array(self.terrain_matrix)
+            self.exit_bits = np.array(self.exit_bits)
+            for room in changed_rooms:
+                self.update_terrain_map_from_room(room)
+            self.write_terrain_store()
+            self.open_terrain_store()
 
+        else:
 
-# networkx graph of world
+            # changed rooms are reloaded on their next access
+            for room in changed_rooms:
+                self.tiles.tiles.pop((room.row, room.col), None)
+                self.room_hashes[room.js_room_name] = terrain_string_hash(self.room_terrain_string(room))
+
+        return changed_rooms
+
+    @property
+    def world_room_shape(self):
+        world_rows = abs(self.bottom_left_room_js_row_col['row'] - self.top_right_room_js_row_col['row']) + 1
+        world_cols = abs(self.bottom_left_room_js_row_col['col'] - self.top_right_room_js_row_col['col']) + 1
+        return world_rows, world_cols
+
+    def window(self, room_row, room_col, room_rows, room_cols):
+
+        # tile bounds of the rooms
+        y = room_row * 50
+        x = room_col * 50
+        height = room_rows * 50
+        width = room_cols * 50
+
+        if self.tiles is None:
+
+            # slices of the mapped layers
+            cost = self.terrain_matrix[y:y + height, x:x + width]
+            exits = np.unpackbits(self.exit_bits[y:y + height], axis=1,
+                                  count=self.terrain_matrix.shape[1])[:, x:x + width].view(bool)
+
+        else:
+
+            # stitch the tiles together
+            cost = np.empty((height, width), dtype=np.uint8)
+            for window_row in range(0, room_rows):
+                for window_col in range(0, room_cols):
+                    cost[window_row * 50:(window_row + 1) * 50, window_col * 50:(window_col + 1) * 50] = \
+                        self.tiles.tile(room_row + window_row, room_col + window_col)
+            exits = np.tile(ROOM_EDGE_MASK, (room_rows, room_cols))
+
+        return cost, exits
+
+    def is_exit(self, x, y):
+        if self.tiles is None:
+            return bool((self.exit_bits[y, x >> 3] >> (7 - (x & 7))) & 1)
+        else:
+            return bool(ROOM_EDGE_MASK[y % 50, x % 50])
+
+    def read_terrain_store(self):
+
+        # nothing stored yet
+        if not os.path.exists(self.terrain_store_path):
+            return None
+
+        # read and validate the header
+        with open(self.terrain_store_path, 'rb') as handle:
+            header = handle.read(TERRAIN_STORE_HEADER_SIZE)
+        if len(header) < TERRAIN_STORE_HEADER_SIZE:
+            logger.info(f'terrain store {self.terrain_store_path} is truncated')
+            return None
+        magic, version, origin_row, origin_col, world_rows, world_cols = TERRAIN_STORE_HEADER.unpack_from(header)
+        if magic != TERRAIN_STORE_MAGIC or version != TERRAIN_STORE_VERSION:
+            logger.info(f'terrain store {self.terrain_store_path} is version {version}')
+            return None
+
+        # map the layers without reading them
+        rows = world_rows * 50
+        cols = world_cols * 50
+        return {
+            'origin_row': origin_row,
+            'origin_col': origin_col,
+            'world_rows': world_rows,
+            'world_cols': world_cols,
+            'terrain_matrix': np.memmap(self.terrain_store_path, dtype=np.uint8, mode='r',
+                                        offset=TERRAIN_STORE_HEADER_SIZE, shape=(rows, cols)),
+            'exit_bits': np.memmap(self.terrain_store_path, dtype=np.uint8, mode='r',
+                                   offset=TERRAIN_STORE_HEADER_SIZE + rows * cols, shape=(rows, (cols + 7) // 8))
+        }
+
+    def store_matches_world(self, stored_terrain):
+        if stored_terrain is None:
+            return False
+        if stored_terrain['origin_row'] != self.bottom_left_room_js_row_col['row'] or \
+                stored_terrain['origin_col'] != self.bottom_left_room_js_row_col['col'] or \
+                (stored_terrain['world_rows'], stored_terrain['world_cols']) != self.world_room_shape:
+            logger.info(f'terrain store {self.terrain_store_path} has different world bounds')
+            return False
+        return True
+
+    def open_terrain_store(self):
+        logger.info(f'mapping terrain store {self.terrain_store_path}')
+        stored_terrain = self.read_terrain_store()
+        self.terrain_matrix = stored_terrain['terrain_matrix']
+        self.exit_bits = stored_terrain['exit_bits']
+
+    def publish_shared_terrain(self):
+
+        # only a fully built world can be shared
+        if self.tiles is not None:
+            logger.info('tiled terrain can not be published to shared memory')
+            return None
+
+        # copy each layer into a shared block once and read from the shared copy from now on
+        shared_terrain = {
+            'bottom_left_room_js_row_col': self.bottom_left_room_js_row_col,
+            'top_right_room_js_row_col': self.top_right_room_js_row_col,
+            'layers': {}
+        }
+        for layer_name in ['terrain_matrix', 'exit_bits']:
+            layer = getattr(self, layer_name)
+            shared_block = shared_memory.SharedMemory(create=True, size=max(1, layer.nbytes))
+            shared_layer = np.ndarray(layer.shape, dtype=np.uint8, buffer=shared_block.buf)
+            shared_layer[:] = layer
+            shared_layer.flags.writeable = False
+            setattr(self, layer_name, shared_layer)
+            self.shared_memory_blocks.append(shared_block)
+            shared_terrain['layers'][layer_name] = {'name': shared_block.name, 'shape': layer.shape}
+        self.shared_memory_owner = True
+
+        logger.info(f'published terrain to shared memory {shared_terrain}')
+        return shared_terrain
+
+    def attach_shared_terrain(self, shared_terrain):
+
+        # the publisher has to be describing the same world
+        if shared_terrain['bottom_left_room_js_row_col'] != self.bottom_left_room_js_row_col or \
+                shared_terrain['top_right_room_js_row_col'] != self.top_right_room_js_row_col:
+            logger.info('shared terrain has different world bounds, loading terrain normally')
+            self.load_terrain()
+            return
+
+        # map each layer read only with zero copies
+        for layer_name, layer_info in shared_terrain['layers'].items():
+            shared_block = attach_shared_memory(layer_info['name'])
+            shared_layer = np.ndarray(layer_info['shape'], dtype=np.uint8, buffer=shared_block.buf)
+            shared_layer.flags.writeable = False
+            setattr(self, layer_name, shared_layer)
+            self.shared_memory_blocks.append(shared_block)
+        logger.info(f'attached to shared terrain {shared_terrain}')
+
+    def close_shared_terrain(self):
+
+        # keep the layers readable after the shared blocks go away
+        if len(self.shared_memory_blocks) > 0:
+            self.terrain_matrix = np.array(self.terrain_matrix)
+            self.exit_bits = np.array(self.exit_bits)
+
+        # only the publisher removes the blocks
+        for shared_block in self.shared_memory_blocks:
+            shared_block.close()
+            if self.shared_memory_owner:
+                shared_block.unlink()
+        self.shared_memory_blocks = []
+        self.shared_memory_owner = False
+
+    def write_terrain_store(self):
+
+        # header padded out to a fixed size
+        world_rows, world_cols = self.world_room_shape
+        header = TERRAIN_STORE_HEADER.pack(TERRAIN_STORE_MAGIC, TERRAIN_STORE_VERSION,
+                                           self.bottom_left_room_js_row_col['row'],
+                                           self.bottom_left_room_js_row_col['col'], world_rows, world_cols)
+        header = header.ljust(TERRAIN_STORE_HEADER_SIZE, b'\0')
+
+        # write to a temp file and swap so readers never map a partial store
+        temp_path = f'{self.terrain_store_path}.tmp'
+        with open(temp_path, 'wb') as handle:
+            handle.write(header)
+            handle.write(np.ascontiguousarray(self.terrain_matrix, dtype=np.uint8).tobytes())
+            handle.write(np.ascontiguousarray(self.exit_bits, dtype=np.uint8).tobytes())
+        os.replace(temp_path, self.terrain_store_path)
+
+        # room hashes that go with the store
+        with open(self.room_hashes_path, 'wb') as handle:
+            pickle.dump(self.room_hashes, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+# rooms, terrain and objects of the world
 class World:
 
-    def __init__(self, config_file_location):
+    def __init__(self, config_file_location, shared_terrain=None):
 
         # read world configuration parameters
         config = configparser.ConfigParser()
@@ -334,129 +779,701 @@ class World:
         self.bottom_left_room_js_row_col = js_room_row_col(config['WORLD']['bottom_left_room'].strip())
         self.top_right_room_js_row_col = js_room_row_col(config['WORLD']['top_right_room'].strip())
 
-        # terrain
-        self.terrain = Terrain(api=self.api, world=self)
-
-        # cache networkx grid
-        self.networkx_graph = None
-        self.networkx_graph_pickle_path = 'data/networkx_graph.pickle'
-        if os.path.exists(self.networkx_graph_pickle_path):
-            with open(self.networkx_graph_pickle_path, 'rb') as handle:
-                self.networkx_graph = pickle.load(handle)
-
-        # networkx grid
-        self.init_networkx_graph()
+        # where caches and terrain stores are kept
+        self.data_directory = config['WORLD']['data_directory'] if 'data_directory' in config['WORLD'] else 'data'
+
+        # terrain fetching (concurrent requests for missing rooms with periodic checkpoints of the string cache)
+        self.terrain_fetch_workers = int(config['WORLD']['terrain_fetch_workers']) \
+            if 'terrain_fetch_workers' in config['WORLD'] else 8
+        self.terrain_checkpoint_rooms = int(config['WORLD']['terrain_checkpoint_rooms']) \
+            if 'terrain_checkpoint_rooms' in config['WORLD'] else 50
+
+        # terrain backend (dense maps the whole world, tiled loads rooms on first use within a memory budget)
+        self.terrain_backend = config['WORLD']['terrain_backend'] if 'terrain_backend' in config['WORLD'] else 'dense'
+        self.terrain_memory_budget_mb = float(config['WORLD']['terrain_memory_budget_mb']) \
+            if 'terrain_memory_budget_mb' in config['WORLD'] else 64
+
+        # terrain (attached to another process's shared memory when planning in a worker)
+        self.terrain = Terrain(api=self.api, world=self, shared_terrain=shared_terrain)
+
+        # path finding searches a window of rooms around the endpoints (neighbours come straight from the grid)
+        self.path_room_margin = int(config['WORLD']['path_room_margin']) if 'path_room_margin' in config['WORLD'] else 1
+        self.search_grids = OrderedDict()
+
+        # grid search used inside the window (jump point search skips ahead across open plains, auto searches from
+        # both ends on routes at least bidirectional_path_range apart and runs a* on the rest), both opt in: on the
+        # benchmark bidirectional expands ~8% fewer tiles than a* on long routes but isn't faster in python
+        self.path_search_mode = config['WORLD']['path_search_mode'] if 'path_search_mode' in config['WORLD'] else 'astar'
+        self.bidirectional_path_range = int(config['WORLD']['bidirectional_path_range']) \
+            if 'bidirectional_path_range' in config['WORLD'] else 100
+
+        # array kernels (a* and store simulation) run compiled by numba or as plain python (auto picks numba when
+        # it's installed, both give the same answers)
+        self.kernel_backend = resolve_backend(config['WORLD']['kernel_backend']
+                                              if 'kernel_backend' in config['WORLD'] else 'auto')
+
+        # routes at least hierarchical_path_range long are solved on the room exit graph first, then refined room by
+        # room (off by 0, the default, those routes can cost up to ~9% more than the full window search's)
+        self.hierarchical_path_range = int(config['WORLD']['hierarchical_path_range']) \
+            if 'hierarchical_path_range' in config['WORLD'] else 0
+        self.room_graphs = {}
+
+        # alt landmark distance fields (a better a* heuristic on big worlds, built offline with build_landmarks and
+        # mapped the first time a search can use them)
+        self.landmark_count = int(config['WORLD']['landmark_count']) if 'landmark_count' in config['WORLD'] else 8
+        self.landmarks_path = os.path.join(self.data_directory,
+                                           f'landmarks_{self.host_pickle_key}_{self.terrain.shard}')
+        self.landmarks = None
+        self.landmarks_terrain_version = None
+        self.landmarks_loaded = False
+
+        # space time planning searches up to the slowest straight walk (all swamp) plus some slack for waits and detours
+        self.space_time_slack = int(config['WORLD']['space_time_slack']) if 'space_time_slack' in config['WORLD'] else 50
+        self.space_time_max_expanded = int(config['WORLD']['space_time_max_expanded']) \
+            if 'space_time_max_expanded' in config['WORLD'] else 100000
+
+        # flow fields towards hot targets (sources, spawns, controllers), shared by every creep heading there
+        self.flow_field_cache_size = int(config['WORLD']['flow_field_cache_size']) \
+            if 'flow_field_cache_size' in config['WORLD'] else 32
+        self.flow_fields = OrderedDict()
+
+        # exit distance tables (built offline, or the first time a route cost is estimated without them)
+        self.exit_tables_path = os.path.join(self.data_directory,
+                                             f'exits_{self.host_pickle_key}_{self.terrain.shard}.npz')
+        self.exit_tables = None
+        self.exit_tables_terrain_version = None
+        self.path_search_stats = {'searches': 0, 'expanded': 0, 'pushed': 0}
+
+        # recently found paths, keyed by everything the search depends on (stale layer versions simply stop matching)
+        self.path_cache_size = int(config['WORLD']['path_cache_size']) if 'path_cache_size' in config['WORLD'] else 256
+        self.path_cache = OrderedDict()
+        self.path_cache_hits = 0
+        self.path_cache_misses = 0
 
         # objects
         self.game_objects = {}
 
+        # nodes of impassable static objects (spawns, controllers, sources) with a version for anything built on them
+        self.static_obstacle_ids = {}
+        self.static_obstacles = frozenset()
+        self.static_obstacle_version = 0
+
+    def publish_shared_terrain(self):
+        return self.terrain.publish_shared_terrain()
+
+    def close_shared_terrain(self):
+        self.terrain.close_shared_terrain()
+
     def get_snapshot(self):
-        self.game_objects = {}
+        self.init_new_turn()
         for player in self.players:
-            self.game_objects.update(player.get_snapshot())
+            player.get_snapshot()
 
     def point(self, x=0, y=0, snapshot_json=None):
         return Point(x=x, y=y, snapshot_json=snapshot_json, world=self)
 
     def init_new_turn(self):
         self.game_objects = {}
+        if self.static_obstacles:
+            self.static_obstacle_ids = {}
+            self.static_obstacles = frozenset()
+            self.static_obstacle_version += 1
+
+    def add_game_objects(self, game_objects):
+        self.game_objects.update(game_objects)
+
+        # keep the static obstacle layer in step with the objects (only impassable static objects block)
+        static_obstacle_ids = dict(self.static_obstacle_ids)
+        for universal_id, game_object in game_objects.items():
+            if game_object.static_object and not game_object.passable:
+                static_obstacle_ids[universal_id] = game_object.starting_location.node
+            else:
+                static_obstacle_ids.pop(universal_id, None)
+        if static_obstacle_ids != self.static_obstacle_ids:
+            self.static_obstacle_ids = static_obstacle_ids
+            self.static_obstacles = frozenset(static_obstacle_ids.values())
+            self.static_obstacle_version += 1
+
+    def static_layer(self, grid):
+
+        # window indexes of the static obstacles, rebuilt for a grid only when the layer version moves on
+        if grid.static_layer_version != self.static_obstacle_version:
+            grid.static_layer = frozenset([grid.index(x, y) for x, y in self.static_obstacles if grid.contains(x, y)])
+            grid.static_layer_version = self.static_obstacle_version
+        return grid.static_layer
+
+    def search_grid(self, *points):
+
+        # rooms spanned by the points plus a margin, kept inside the world (the whole world without points)
+        world_rows, world_cols = self.terrain.world_room_shape
+        if points:
+            min_row = max(0, min([pt.y for pt in points]) // 50 - self.path_room_margin)
+            max_row = min(world_rows - 1, max([pt.y for pt in points]) // 50 + self.path_room_margin)
+            min_col = max(0, min([pt.x for pt in points]) // 50 - self.path_room_margin)
+            max_col = min(world_cols - 1, max([pt.x for pt in points]) // 50 + self.path_room_margin)
+            return self.window_grid(min_row, min_col, max_row, max_col)
+        return self.window_grid(0, 0, world_rows - 1, world_cols - 1)
+
+    def window_grid(self, min_row, min_col, max_row, max_col):
+
+        # reuse the window if we've searched it before
+        grid_key = (min_row, min_col, max_row, max_col, self.terrain.version)
+        if grid_key in self.search_grids:
+            self.search_grids.move_to_end(grid_key)
+            return self.search_grids[grid_key]
+
+        # build the window
+        cost, exits = self.terrain.window(min_row, min_col, max_row - min_row + 1, max_col - min_col + 1)
+        grid = SearchGrid(cost=cost, exits=exits, x_offset=min_col * 50, y_offset=min_row * 50)
+        self.search_grids[grid_key] = grid
+        while len(self.search_grids) > SEARCH_GRID_CACHE_SIZE:
+            self.search_grids.popitem(last=False)
+        return grid
+
+    def cost_view(self, grid, bad_pts=[], include_static_objects=True, ignore_terrain_differences=False):
+
+        # terrain is read through layers (static objects, then the points to avoid) rather than a stamped copy
+        static_indexes = self.static_layer(grid) if include_static_objects else frozenset()
+        override_indexes = set([grid.index(pt.x, pt.y) for pt in bad_pts if grid.contains(pt.x, pt.y)])
+        return CostView(grid, ignore_terrain_differences, static_indexes, override_indexes)
+
+    def room_portals(self, row, col):
+
+        # sides of the room as (first edge tile, step along the side, step into the next room), corners are walls
+        world_rows, world_cols = self.terrain.world_room_shape
+        x = col * 50
+        y = row * 50
+        sides = []
+        if col > 0:
+            sides.append(((x, y + 1), (0, 1), (-1, 0)))
+        if col < world_cols - 1:
+            sides.append(((x + 49, y + 1), (0, 1), (1, 0)))
+        if row > 0:
+            sides.append(((x + 1, y), (1, 0), (0, -1)))
+        if row < world_rows - 1:
+            sides.append(((x + 1, y + 49), (1, 0), (0, 1)))
+
+        # one portal in the middle of every run of exit tiles that are walkable on both sides of the edge
+        portals = []
+        for (start_x, start_y), (step_x, step_y), (cross_x, cross_y) in sides:
+            run = []
+            for position in range(0, 49):
+                tile_x = start_x + step_x * position
+                tile_y = start_y + step_y * position
+                if position < 48 and self.terrain.cost(tile_x, tile_y) != 255 and \
+                        self.terrain.cost(tile_x + cross_x, tile_y + cross_y) != 255:
+                    run.append((tile_x, tile_y))
+                elif run:
+                    portal_x, portal_y = run[len(run) // 2]
+                    portals.append(((portal_x, portal_y), (portal_x + cross_x, portal_y + cross_y)))
+                    run = []
+        return portals
+
+    def room_graph(self, row, col, ignore_terrain_differences=False):
+
+        # built the first time a route passes through the room, rebuilt when the terrain changes
+        graph_key = (row, col, ignore_terrain_differences)
+        if graph_key not in self.room_graphs or self.room_graphs[graph_key][0] != self.terrain.version:
+            room_graph = RoomGraph(self.window_grid(row, col, row, col), self.room_portals(row, col),
+                                   ignore_terrain_differences)
+            self.room_graphs[graph_key] = (self.terrain.version, room_graph)
+        return self.room_graphs[graph_key][1]
+
+    def build_room_graphs(self, ignore_terrain_differences=False):
+        world_rows, world_cols = self.terrain.world_room_shape
+        logger.info(f'building room graphs for {world_rows * world_cols} rooms')
+        for row in range(0, world_rows):
+            for col in range(0, world_cols):
+                self.room_graph(row, col, ignore_terrain_differences)
+
+    def flow_field(self, target_point, include_static_objects=True, ignore_terrain_differences=False):
+
+        # one field per target and layer versions, over the target's room and its margin
+        field_key = (target_point.node, include_static_objects, ignore_terrain_differences,
+                     self.static_obstacle_version if include_static_objects else None, self.terrain.version)
+        if field_key in self.flow_fields:
+            self.flow_fields.move_to_end(field_key)
+            return self.flow_fields[field_key]
+
+        grid, graph = self.csr_adjacency([target_point], include_static_objects=include_static_objects,
+                                         ignore_terrain_differences=ignore_terrain_differences)
+        flow_field = FlowField(grid, graph, grid.index(target_point.x, target_point.y))
+        self.flow_fields[field_key] = flow_field
+        while len(self.flow_fields) > self.flow_field_cache_size:
+            self.flow_fields.popitem(last=False)
+        return flow_field
+
+    def hot_targets(self):
+
+        # where most director paths end: harvest locations of kingdom sources, spawns and controllers
+        targets = []
+        for game_object in self.game_objects.values():
+            if game_object.specific_type == 'source':
+
+                # only sources with a kingdom flag to harvest towards (players without red flags have none)
+                if game_object.player is not None and game_object.player.kingdom_flags:
+                    targets.append(game_object.harvest_location)
+            elif game_object.specific_type in ['spawn', 'controller']:
+                targets.append(game_object.starting_location)
+        return targets
+
+    def build_flow_fields(self, targets=None):
+        if targets is None:
+            targets = self.hot_targets()
+        return [self.flow_field(target) for target in targets]
+
+    def next_direction(self, from_point, target_point, include_static_objects=True, ignore_terrain_differences=False):
+        return self.flow_field(target_point, include_static_objects,
+                               ignore_terrain_differences).next_direction(from_point.x, from_point.y)
+
+    def build_landmarks(self, count=None, save=True):
+
+        # landmark fields over the whole world on the bare terrain
+        count = self.landmark_count if count is None else count
+        grid = self.search_grid()
+        rooms = self.terrain.world_rooms
+        logger.info(f'building {count} landmarks over {grid.size} tiles')
+        self.landmarks = Landmarks.build(grid, grid.csr_adjacency(grid.base_weights()[0]), count,
+                                         rooms=np.array([(room.row, room.col) for room in rooms], dtype=np.int32),
+                                         room_names=np.array([room.js_room_name for room in rooms], dtype=str),
+                                         room_hashes=np.array([self.terrain.room_hashes.get(room.js_room_name, '')
+                                                               for room in rooms], dtype=str))
+        self.landmarks_terrain_version = self.terrain.version
+        if save:
+            self.landmarks.save(self.landmarks_path)
+        return self.landmarks
+
+    def load_landmarks(self):
+        self.landmarks_loaded = True
+        if not os.path.exists(os.path.join(self.landmarks_path, 'nodes.npy')):
+            return None
+        landmarks = Landmarks.load(self.landmarks_path)
+        if landmarks.forward.shape[1:] != self.terrain.shape or \
+                not self.stored_rooms_match(landmarks.rooms, landmarks.room_names, landmarks.room_hashes):
+            return None
+        self.landmarks = landmarks
+        self.landmarks_terrain_version = self.terrain.version
+        return landmarks
+
+    def search_landmarks(self):
+        if self.landmarks is None and not self.landmarks_loaded:
+            self.load_landmarks()
+        if self.landmarks is not None and self.landmarks_terrain_version == self.terrain.version:
+            return self.landmarks
+        return None
+
+    def build_exit_tables(self, save=True):
+
+        # table objects by room
+        room_objects = {}
+        for game_object in self.game_objects.values():
+            if game_object.specific_type in EXIT_TABLE_OBJECT_TYPES:
+                x, y = game_object.starting_location.node
+                room_objects.setdefault((y // 50, x // 50), []).append((game_object.universal_id, (x, y)))
+
+        # costs between every portal and object of each room on the bare terrain
+        room_tables = []
+        for room in self.terrain.world_rooms:
+            grid = self.window_grid(room.row, room.col, room.row, room.col)
+            room_graph = self.room_graph(room.row, room.col)
+            objects = room_objects.get((room.row, room.col), [])
+            table_indexes = [grid.index(x, y) for x, y in room_graph.portals + [node for object_id, node in objects]]
+            costs = np.empty((0, 0))
+            if table_indexes:
+                costs = scaled_distance_matrix(grid.csr_adjacency(grid.base_weights()[0]), table_indexes, table_indexes)
+            room_tables.append({'row': room.row, 'col': room.col, 'room_name': room.js_room_name,
+                                'room_hash': self.terrain.room_hashes.get(room.js_room_name, ''),
+                                'portals': list(zip(room_graph.portals, room_graph.partners)),
+                                'crossing_weights': room_graph.crossing_weights, 'objects': objects, 'costs': costs})
+        self.exit_tables = ExitTables.from_rooms(room_tables)
+        self.exit_tables_terrain_version = self.terrain.version
+        logger.info(f'built exit tables for {len(room_tables)} rooms and {len(self.exit_tables.object_numbers)} objects')
+
+        if save:
+            self.exit_tables.save(self.exit_tables_path)
+        return self.exit_tables
+
+    def stored_rooms_match(self, rooms, room_names, room_hashes):
+
+        # stored tables have to have their rooms in the same place with the same terrain
+        for room_number, room_name in enumerate(room_names.tolist()):
+            room = Room(room_name=room_name, world=self)
+            room_hash = str(room_hashes[room_number])
+            if (room.row, room.col) != tuple(rooms[room_number].tolist()) or \
+                    self.terrain.room_hashes.get(room_name, room_hash) != room_hash:
+                logger.info(f'stored tables are out of date at {room_name}')
+                return False
+        return True
+
+    def load_exit_tables(self):
+        if not os.path.exists(self.exit_tables_path):
+            return None
+        exit_tables = ExitTables.load(self.exit_tables_path)
+        if not self.stored_rooms_match(exit_tables.rooms, exit_tables.room_names, exit_tables.room_hashes):
+            return None
+        self.exit_tables = exit_tables
+        self.exit_tables_terrain_version = self.terrain.version
+        return exit_tables
+
+    def estimate_route_cost(self, from_object, to_object):
+
+        # table lookups between sources, controllers and spawns (the tables are rebuilt for objects they don't know
+        # and reloaded once the terrain has been refreshed)
+        for game_object in [from_object, to_object]:
+            if game_object.specific_type not in EXIT_TABLE_OBJECT_TYPES:
+                raise ValueError(f'no exit table routes for {game_object.specific_type} {game_object.universal_id}, '
+                                 f'expected one of {EXIT_TABLE_OBJECT_TYPES}')
+        object_ids = [from_object.universal_id, to_object.universal_id]
+        current_tables = self.exit_tables is not None and self.exit_tables_terrain_version == self.terrain.version
+        if not current_tables and self.load_exit_tables() is None:
+            self.build_exit_tables()
+        elif any([object_id not in self.exit_tables.object_numbers for object_id in object_ids]):
+            self.build_exit_tables()
+        missing_ids = [object_id for object_id in object_ids if object_id not in self.exit_tables.object_numbers]
+        if missing_ids:
+            raise ValueError(f'no exit table routes for {missing_ids}, they are not world objects')
+        return self.exit_tables.route_cost(self.exit_tables.object_numbers[from_object.universal_id],
+                                           self.exit_tables.object_numbers[to_object.universal_id]) / PATH_WEIGHT_SCALE
+
+    def blocked_nodes(self, bad_pts=[], include_static_objects=True):
+        blocked_nodes = set(self.static_obstacles) if include_static_objects else set()
 
-    def init_networkx_graph(self):
-
-        if self.networkx_graph is None:
-
-            # init empty graph
-            self.networkx_graph = nx.Graph()
-
-            # parameters for easy calcs
-            num_rows, num_cols = self.terrain.terrain_matrix.shape
-            max_x = num_cols - 1
-            max_y = num_rows - 1
-
-            # create a point for each location on map
-            logger.info('init networkx graph')
-            for x in range(0, num_cols):
-                for y in range(0, num_rows):
-                    start_point = Point(x=x, y=y, world=self)
-                    for d_x in [-1, 0, 1]:
-                        for d_y in [-1, 0, 1]:
-
-                            # don't worry about the center point
-                            if d_x == 0 and d_y == 0:
-                                continue
-
-                            # create end node
-                            end_x = x + d_x
-                            end_y = y + d_y
-
-                            # create end node
-                            end_point = Point(x=end_x, y=end_y, world=self)
-
-                            # test if this point is valid
-                            if end_point.x > max_x or end_point.x < 0:
-                                continue
-                            if end_point.y > max_y or end_point.y < 0:
-                                continue
-
-                            # linkage logic for exit tiles
-                            if start_point.edge_type == 'N' and end_point.edge_type is not None and d_x != 0:
-                                continue
-                            if start_point.edge_type == 'S' and end_point.edge_type is not None and d_x != 0:
-                                continue
-                            if start_point.edge_type == 'E' and end_point.edge_type is not None and d_y != 0:
-                                continue
-                            if start_point.edge_type == 'W' and end_point.edge_type is not None and d_y != 0:
-                                continue
-
-                            # add edges
-                            self.networkx_graph.add_nodes_from([start_point.node, end_point.node])
-                            self.networkx_graph.add_edge(start_point.node, end_point.node)
-
-            # save the graph
-            with open(self.networkx_graph_pickle_path, 'wb') as handle:
-                pickle.dump(self.networkx_graph, handle, protocol=pickle.HIGHEST_PROTOCOL)
-
-    def path_between(self, from_point, to_point, bad_pts=[], include_static_objects=True, ignore_terrain_differences=False):
-        logger.info(f'finding a path between {from_point.js_x_y} to {to_point.js_x_y}')
-        # find path with just terrain
-        start_grid = self.terrain.terrain_matrix.copy()
+        # dynamic points to remove
+        for pt in bad_pts:
+            blocked_nodes.add(pt.node)
+        return blocked_nodes
+
+    def csr_adjacency(self, points=(), bad_pts=[], include_static_objects=True, ignore_terrain_differences=False):
+
+        # sparse directed graph of the window around the points, weighted like path_between
+        grid = self.search_grid(*points)
+        blocked_indexes = set([grid.index(x, y) for x, y in self.blocked_nodes(bad_pts, include_static_objects)
+                               if grid.contains(x, y)])
+        weights = grid.tile_weights(blocked_indexes, ignore_terrain_differences)
+        return grid, grid.csr_adjacency(weights)
+
+    def save_csr_adjacency(self, path=None, include_static_objects=False, ignore_terrain_differences=False):
+
+        # whole world graph, node index is y * world width + x
+        if path is None:
+            path = os.path.join(self.data_directory,
+                                f'adjacency_{self.host_pickle_key}_{self.terrain.shard}.npz')
+        grid, graph = self.csr_adjacency(include_static_objects=include_static_objects,
+                                         ignore_terrain_differences=ignore_terrain_differences)
+        logger.info(f'saving {graph.nnz} edge adjacency for {grid.size} tiles to {path}')
+        save_npz(path, graph)
+        return path
 
-        # terrain ignorance (for roads and the like)
-        if ignore_terrain_differences:
-            start_grid[start_grid == 10] = 2
-            start_grid[start_grid == 1] = 2
+    def distance_matrix(self, from_points, to_points, bad_pts=[], include_static_objects=True,
+                        ignore_terrain_differences=False):
+
+        # path costs from every from point to every to point in one csgraph call
+        grid, graph = self.csr_adjacency(list(from_points) + list(to_points), bad_pts, include_static_objects,
+                                         ignore_terrain_differences)
+        return distance_matrix(graph,
+                               [grid.index(pt.x, pt.y) for pt in from_points],
+                               [grid.index(pt.x, pt.y) for pt in to_points])
+
+    def distances_from(self, from_point, to_points, bad_pts=[], include_static_objects=True,
+                       ignore_terrain_differences=False):
+        return self.distance_matrix([from_point], to_points, bad_pts, include_static_objects,
+                                    ignore_terrain_differences)[0]
+
+    def path_between(self, from_point, to_point, bad_pts=[], include_static_objects=True, ignore_terrain_differences=False,
+                     radius=0):
+
+        # static obstacles only matter to searches that include them
+        path_key = (from_point.node, to_point.node, radius, ignore_terrain_differences, include_static_objects,
+                    self.static_obstacle_version if include_static_objects else None, self.terrain.version,
+                    frozenset([pt.node for pt in bad_pts]))
+        if path_key in self.path_cache:
+            self.path_cache_hits += 1
+            self.path_cache.move_to_end(path_key)
+            path = self.path_cache[path_key]
+            return None if path is None else list(path)
+        self.path_cache_misses += 1
+
+        path = self.search_path(from_point, to_point, bad_pts, include_static_objects, ignore_terrain_differences, radius)
+        if self.path_cache_size > 0:
+            self.path_cache[path_key] = None if path is None else tuple(path)
+            while len(self.path_cache) > self.path_cache_size:
+                self.path_cache.popitem(last=False)
+        return path
 
-        # static object pts
-        if include_static_objects:
-            for game_object in self.game_objects.values():
-                if game_object.static_object:
-                    if not game_object.passable:
-                        pt = game_object.starting_location
-                        start_grid[pt.y, pt.x] = 255
+    def path_search(self, path_range):
+        if self.path_search_mode == 'auto':
+            mode = 'bidirectional' if path_range >= self.bidirectional_path_range else 'astar'
+        else:
+            mode = self.path_search_mode
+        if self.kernel_backend == 'numba' and mode in COMPILED_PATH_SEARCHES:
+            return COMPILED_PATH_SEARCHES[mode]
+        return PATH_SEARCHES[mode]
 
-        # dynamic points to remove
-        for pt in bad_pts:
-            start_grid[pt.y, pt.x] = 255
+    def search_path(self, from_point, to_point, bad_pts=[], include_static_objects=True, ignore_terrain_differences=False,
+                    radius=0):
+        logger.info(f'finding a path between {from_point.js_x_y} to {to_point.js_x_y}')
+
+        # long routes go through the room graph (falling back to the full search when it can't find one)
+        if self.hierarchical_path_range and from_point.range(to_point) >= self.hierarchical_path_range:
+            path = self.hierarchical_path(from_point, to_point, bad_pts, include_static_objects,
+                                          ignore_terrain_differences)
+            if path is not None:
+
+                # the room graph runs to the target itself, so stop at the first tile in range
+                for path_index, (x, y) in enumerate(path):
+                    if max(abs(x - to_point.x), abs(y - to_point.y)) <= radius:
+                        return path[:path_index + 1]
+
+        # search window around the endpoints
+        grid = self.search_grid(from_point, to_point)
+        cost_view = self.cost_view(grid, bad_pts, include_static_objects, ignore_terrain_differences)
+        source = grid.index(from_point.x, from_point.y)
+
+        # landmark bounds only hold for the terrain they were built on with its real differences (and exact targets)
+        heuristic = None
+        if not ignore_terrain_differences and radius == 0 and self.search_landmarks() is not None:
+            heuristic = memoryview(self.landmarks.heuristic(grid, to_point.x, to_point.y, source, cost_view.min_weight))
+
+        path_search = self.path_search(from_point.range(to_point))
+        path = path_search(grid, source, [grid.index(to_point.x, to_point.y)], cost_view, stats=self.path_search_stats,
+                           heuristic=heuristic, radius=radius)[0]
+        if path is None:
+            logger.info(f'no path between {from_point.js_x_y} to {to_point.js_x_y}')
+            return None
+        return [grid.node(index) for index in path]
 
-        # define weight function
-        def weight_func(from_tuple, to_tuple, edge_dictionary):
-            return start_grid[from_tuple[1], from_tuple[0]]
+    def hierarchical_path(self, from_point, to_point, bad_pts=[], include_static_objects=True,
+                          ignore_terrain_differences=False):
+        from_room = (from_point.y // 50, from_point.x // 50)
+        to_room = (to_point.y // 50, to_point.x // 50)
+        if from_room == to_room:
+            return None
 
-        path = nx.astar_path(G=self.networkx_graph, source=from_point.node, target=to_point.node, weight=weight_func)
+        # costs from the start to the portals of its room and from the portals of the goal room to the goal
+        endpoint_costs = []
+        for point, room, reverse in [(from_point, from_room, False), (to_point, to_room, True)]:
+            grid = self.window_grid(room[0], room[1], room[0], room[1])
+            cost_view = self.cost_view(grid, bad_pts, include_static_objects, ignore_terrain_differences)
+            graph = grid.csr_adjacency(grid.tile_weights(cost_view.static_indexes | cost_view.override_indexes,
+                                                         ignore_terrain_differences))
+            if reverse:
+                graph = graph.T.tocsr()
+            portal_indexes = [grid.index(x, y) for x, y in self.room_graph(*room, ignore_terrain_differences).portals]
+            endpoint_costs.append(scaled_distance_matrix(graph, [grid.index(point.x, point.y)], portal_indexes)[0]
+                                  if portal_indexes else [])
+        start_costs, goal_costs = endpoint_costs
+
+        # portal search (plains are the cheapest terrain, so chebyshev distance times their weight is admissible)
+        # that never steps onto a blocked portal
+        blocked_nodes = self.blocked_nodes(bad_pts, include_static_objects)
+        goal_node = (-1, -1)
+
+        def links(node):
+            room = (node[1] // 50, node[0] // 50)
+            room_graph = self.room_graph(*room, ignore_terrain_differences)
+            portal_number = room_graph.portal_index[node]
+            next_nodes = []
+            if room == to_room and np.isfinite(goal_costs[portal_number]):
+                next_nodes.append((goal_node, int(goal_costs[portal_number])))
+
+            # across the room, then over the edge into the next one
+            for other_number, other_portal in enumerate(room_graph.portals):
+                if other_number != portal_number and np.isfinite(room_graph.costs[portal_number, other_number]):
+                    next_nodes.append((other_portal, int(room_graph.costs[portal_number, other_number])))
+            next_nodes.append((room_graph.partners[portal_number], room_graph.crossing_weights[portal_number]))
+            return [(next_node, cost) for next_node, cost in next_nodes if next_node not in blocked_nodes]
+
+        def heuristic(node):
+            if node == goal_node:
+                return 0
+            return max(abs(node[0] - to_point.x), abs(node[1] - to_point.y)) * 2 * PATH_WEIGHT_SCALE
+
+        starts = [(portal, int(start_costs[portal_number]))
+                  for portal_number, portal in enumerate(self.room_graph(*from_room, ignore_terrain_differences).portals)
+                  if np.isfinite(start_costs[portal_number]) and portal not in blocked_nodes]
+        route_cost, waypoints = portal_search(starts, goal_node, links, heuristic)
+        if route_cost is None:
+            return None
+        waypoints[-1] = to_point.node
+
+        # refine each leg inside its own room, stepping straight across room edges
+        path = [from_point.node]
+        for waypoint in waypoints:
+            previous = path[-1]
+            if waypoint == previous:
+                continue
+            room = (waypoint[1] // 50, waypoint[0] // 50)
+            if room != (previous[1] // 50, previous[0] // 50):
+                path.append(waypoint)
+                continue
+            grid = self.window_grid(room[0], room[1], room[0], room[1])
+            cost_view = self.cost_view(grid, bad_pts, include_static_objects, ignore_terrain_differences)
+            path_search = self.path_search(max(abs(waypoint[0] - previous[0]), abs(waypoint[1] - previous[1])))
+            leg = path_search(grid, grid.index(*previous), [grid.index(*waypoint)], cost_view,
+                              stats=self.path_search_stats)[0]
+            if leg is None:
+                return None
+            path.extend([grid.node(index) for index in leg[1:]])
         return path
 
+    def nearest(self, origin, targets, radius=0, tick=None, bad_pts=[], include_static_objects=True,
+                ignore_terrain_differences=False):
+
+        # targets are points or game objects (where they are on tick, or where they start, skipping any without one)
+        located_targets = []
+        target_points = []
+        for target in targets:
+            if isinstance(target, Point):
+                target_point = target
+            else:
+                target_point = target.starting_location if tick is None else target.location(tick)
+            if target_point is not None:
+                located_targets.append(target)
+                target_points.append(target_point)
+        if len(target_points) == 0:
+            return None, None
+
+        # one search that stops at whichever target it reaches first
+        grid = self.search_grid(origin, *target_points)
+        cost_view = self.cost_view(grid, bad_pts, include_static_objects, ignore_terrain_differences)
+        path_search = self.path_search(min([origin.range(pt) for pt in target_points]))
+        path, target_number = path_search(grid, grid.index(origin.x, origin.y),
+                                          [grid.index(pt.x, pt.y) for pt in target_points], cost_view,
+                                          stats=self.path_search_stats, radius=radius)
+        if path is None:
+            logger.info(f'no path from {origin.js_x_y} to any of {len(target_points)} targets')
+            return None, None
+        return located_targets[target_number], [grid.node(index) for index in path]
+
+    def reservation_table(self, path_finding_object=None):
+
+        # every impassable thing that moves, other than whoever is planning
+        movers = []
+        for game_object in self.game_objects.values():
+            if not game_object.static_object and not game_object.passable:
+                if path_finding_object is None or path_finding_object.universal_id != game_object.universal_id:
+                    movers.append(game_object)
+        return ReservationTable(movers)
+
+    def body_tick_field(self, from_point, to_point, start_tick, body, start_fatigue=0, radius=0):
+
+        # calc body fatigue stats
+        fatigue_per_move = len([body_part for body_part in body if body_part != 'move'])
+        fatigue_recovery_per_tick = body.count('move') * 2
+
+        # wait out any fatigue we start with (never moving without move parts)
+        if fatigue_recovery_per_tick == 0:
+            return None
+        ready_tick = start_tick
+        if start_fatigue > 0:
+            ready_tick += -(-start_fatigue // fatigue_recovery_per_tick)
+
+        # ticks to the goal from every tile of the window for this body
+        grid = self.search_grid(from_point, to_point)
+        cost_view = self.cost_view(grid)
+        tick_field = TickField(grid, grid.index(to_point.x, to_point.y), cost_view, fatigue_per_move,
+                               fatigue_recovery_per_tick, radius)
+        return grid, cost_view, tick_field, ready_tick, fatigue_per_move, fatigue_recovery_per_tick
+
+    def fastest_path(self, from_point, to_point, start_tick, body, start_fatigue=0, radius=0):
+
+        # time optimal path and arrival ticks for this body, ignoring everything that moves
+        field_setup = self.body_tick_field(from_point, to_point, start_tick, body, start_fatigue, radius)
+        if field_setup is None:
+            return None
+        grid, cost_view, tick_field, ready_tick, fatigue_per_move, fatigue_recovery_per_tick = field_setup
+        path, path_ticks = tick_field.path(grid.index(from_point.x, from_point.y), ready_tick)
+        if path is None:
+            logger.info(f'no path between {from_point.js_x_y} and {to_point.js_x_y} for {body}')
+            return None
+        path_ticks[0] = start_tick
+        return [self.point(*grid.node(index)) for index in path], path_ticks
+
+    def space_time_path(self, from_point, to_point, start_tick, body, start_fatigue=0, radius=0,
+                        path_finding_object=None, reservations=None):
+
+        field_setup = self.body_tick_field(from_point, to_point, start_tick, body, start_fatigue, radius)
+        if field_setup is None:
+            return None
+        grid, cost_view, tick_field, ready_tick, fatigue_per_move, fatigue_recovery_per_tick = field_setup
+        if reservations is None:
+            reservations = self.reservation_table(path_finding_object)
+
+        # the time optimal path will do if nothing is in its way
+        source = grid.index(from_point.x, from_point.y)
+        path, path_ticks = tick_field.path(source, ready_tick)
+        if path is None:
+            logger.info(f'no path between {from_point.js_x_y} and {to_point.js_x_y} for {body}')
+            return None
+
+        # otherwise search (x, y, tick) around everything already claimed
+        if reservations.path_reserved([grid.node(index) for index in path], path_ticks):
+            max_tick = ready_tick + self.space_time_slack + \
+                from_point.range(to_point) * move_ticks(10, fatigue_per_move, max(1, fatigue_recovery_per_tick))
+            path, path_ticks = space_time_path(grid, source, grid.index(to_point.x, to_point.y), ready_tick, cost_view,
+                                               reservations, fatigue_per_move, fatigue_recovery_per_tick, radius=radius,
+                                               max_tick=max_tick, max_expanded=self.space_time_max_expanded,
+                                               stats=self.path_search_stats, tick_field=tick_field)
+            if path is None:
+                logger.info(f'no space time path between {from_point.js_x_y} and {to_point.js_x_y} by {max_tick}')
+                return None
+        path_ticks[0] = start_tick
+        return [self.point(*grid.node(index)) for index in path], path_ticks
+
+    def plan_paths(self, requests):
+
+        # plan (path_finding_object, body, from_point, to_point, start_tick, radius) requests in priority order
+        # (first is highest), each one routing around the paths already planned and claiming its own
+        planned_ids = set([request[0].universal_id for request in requests if request[0] is not None])
+        reservations = ReservationTable([mover for mover in self.reservation_table().movers
+                                         if mover.universal_id not in planned_ids])
+        for path_finding_object, body, from_point, to_point, start_tick, radius in requests:
+            reservations.claim(from_point.node, start_tick)
+
+        plans = []
+        for path_finding_object, body, from_point, to_point, start_tick, radius in requests:
+            if body is None:
+                if path_finding_object is None:
+                    raise ValueError(f'path request from {from_point.js_x_y} needs a body or a path finding object')
+                body = path_finding_object.body
+            if from_point.range(to_point) <= radius:
+                plan = ([from_point], [start_tick])
+            else:
+                plan = self.space_time_path(from_point, to_point, start_tick, body, radius=radius,
+                                            reservations=reservations)
+            if plan is None:
+                logger.info(f'no conflict free path between {from_point.js_x_y} and {to_point.js_x_y}')
+                plans.append((None, None))
+                continue
+            path, path_ticks = plan
+            reservations.claim_path([pt.node for pt in path], path_ticks)
+            plans.append((path, path_ticks))
+        return plans
+
     def path_for_body_at_time(self, from_point, to_point, start_tick, body, start_fatigue=0, radius=0, path_finding_object=None):
 
         # check if we're already there
         if from_point.range(to_point) <= radius:
             return [from_point], [start_tick]
 
+        # take the time optimal path for this body unless something is in the way, then plan around the other
+        # creeps in one search, falling back to walking a static path and replanning
+        space_time_plan = self.space_time_path(from_point, to_point, start_tick, body, start_fatigue, radius,
+                                               path_finding_object)
+        if space_time_plan is not None:
+            return space_time_plan
+        return self.replanning_path_for_body_at_time(from_point, to_point, start_tick, body, start_fatigue, radius,
+                                                     path_finding_object)
+
+    def replanning_path_for_body_at_time(self, from_point, to_point, start_tick, body, start_fatigue=0, radius=0,
+                                         path_finding_object=None):
+
         # calc body fatigue stats
         fatigue_per_move = len([body_part for body_part in body if body_part != 'move'])
         fatigue_recovery_per_tick = body.count('move') * 2
 
         # get start path
-        dumb_path = self.path_between(from_point, to_point)
+        dumb_path = self.path_between(from_point, to_point, radius=radius)
         logger.info(dumb_path)
 
         # define initial parameters
@@ -528,7 +1545,7 @@ class World:
                 logger.info(f'theres an obstacle at {current_move_to_point.js_x_y}!')
                 bad_pts.append(current_move_to_point)
                 logger.info(f'bad pts is now {bad_pts}')
-                dumb_path = self.path_between(current_move_from_point, to_point, bad_pts=bad_pts)
+                dumb_path = self.path_between(current_move_from_point, to_point, bad_pts=bad_pts, radius=radius)
                 current_index = 1
                 current_move_from_point = self.point(x=dumb_path[current_index - 1][0], y=dumb_path[current_index - 1][1])
                 current_move_to_point = self.point(x=dumb_path[current_index][0], y=dumb_path[current_index][1])